@@ -168,30 +168,943 @@ TODO use a single syntax tree representation (normalize parsers)
 
 
 from __builtin__ import AssertionError
+from __builtin__ import Exception
 from __builtin__ import False
 from __builtin__ import IndexError
+from __builtin__ import RuntimeError
 from __builtin__ import True
 from __builtin__ import ValueError
+from __builtin__ import basestring
+from __builtin__ import bytearray
+from __builtin__ import dir
 from __builtin__ import enumerate
-from __builtin__ import exit
+from __builtin__ import float
 from __builtin__ import getattr
+from __builtin__ import hasattr
 from __builtin__ import int
 from __builtin__ import isinstance
+from __builtin__ import issubclass
+from __builtin__ import iter
 from __builtin__ import len
+from __builtin__ import list
+from __builtin__ import max
+from __builtin__ import memoryview
+from __builtin__ import min
 from __builtin__ import object
 from __builtin__ import repr
+from __builtin__ import set
+from __builtin__ import setattr
+from __builtin__ import staticmethod
+from __builtin__ import sorted
 from __builtin__ import str
+from __builtin__ import tuple
 from __builtin__ import type
-from copy import deepcopy
+from __builtin__ import xrange
+from __builtin__ import zip
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from importlib import import_module
+from mmap import ACCESS_READ
+from mmap import mmap
+from re import compile as re_compile
+from re import escape as re_escape
+from thread import allocate_lock as Lock
+from time import time
+from pyparse.util import StrView
 from pyparse.util import println
 
 
-try:
-    assert False # assert must work
-    println('the assert statement does not work, disable optimizations to fix this')
-    exit(1)
-except AssertionError:
-    pass
+class _Fail(object):
+    r""" Type of ``FAIL''. """
+    def __repr__(self):
+        return 'FAIL'
+# ssalc _Fail
+
+
+# returned by rules to signal failure without raising an exception
+FAIL = _Fail()
+
+
+class CutError(Exception):
+    r""" Raised when the parser tries to revert to a state before a cut point.
+
+    See ``ParserSkeleton.commit''.
+    """
+# ssalc CutError
+
+
+class ParseError(ValueError):
+    r""" The data is not well formed, see ``ParserSkeleton.error''.
+
+    ``offset'' is the furthest offset where the parser did not find what it expected,
+    ``line'' and ``column'' start at 1, ``expected'' is a tuple with the names of the
+    rules or other items that were expected there.
+    """
+
+    def __init__(self, offset, line, column, expected):
+        ValueError.__init__(self, offset, line, column, expected)
+        self.offset = offset
+        self.line = line
+        self.column = column
+        self.expected = expected
+
+    def __str__(self):
+        _expected = ', '.join([repr(_e) for _e in self.expected]) or 'nothing'
+        return 'offset %d (line %d, column %d): expected %s' % (self.offset, self.line, self.column, _expected,)
+# ssalc ParseError
+
+
+class Handler(object):
+    r""" Receives the events of a parser in event mode, see ``ParserSkeleton.listen''.
+
+    Events are delivered once they are final (at cut points or ``flush''),
+    events of reverted parse attempts are never delivered.
+    Override the methods of interest.
+    """
+
+    def start(self, name):
+        r""" Start of a ``name'' node. """
+        pass
+
+    def end(self, name):
+        r""" End of a ``name'' node. """
+        pass
+
+    def token(self, name, value):
+        r""" A ``name'' leaf with text or other ``value''. """
+        pass
+# ssalc Handler
+
+
+class CharClass(object):
+    r""" Precompiled character class for ``ParserSkeleton.span'' and ``ParserSkeleton.span_until''.
+
+    ``chars'' is a string with the member characters.
+    ``ranges'' is a sequence of inclusive (low, high) character ranges.
+
+    The scans are done by compiled ``re'' patterns.
+    ``pattern'' and ``not_pattern'' match one member or non-member character.
+    """
+
+    def __init__(self, chars='', ranges=()):
+        object.__init__(self)
+        self.chars = chars
+        self.ranges = tuple(ranges)
+        _set = [re_escape(_c) for _c in chars]
+        _set += [re_escape(_low) + '-' + re_escape(_high) for _low, _high in self.ranges]
+        _set = ''.join(_set)
+        if _set == '':
+            self.pattern = '(?!x)x' # never matches
+            self.not_pattern = '[\\s\\S]' # any character
+        else:
+            self.pattern = '[' + _set + ']'
+            self.not_pattern = '[^' + _set + ']'
+        self.span_re = re_compile(self.pattern + '*')
+        self.until_re = re_compile(self.not_pattern + '*')
+
+    def __contains__(self, c):
+        if c is None:
+            return False
+        if c in self.chars:
+            return True
+        for _low, _high in self.ranges:
+            if _low <= c <= _high:
+                return True
+        return False
+
+    def __repr__(self):
+        _s = ["CharClass(", repr(self.chars), ", ", repr(self.ranges), ")"]
+        return ''.join(_s)
+# ssalc CharClass
+
+
+class StreamBuffer(object):
+    r""" Input buffer that reads a file object on demand.
+
+    Behaves like a str with the whole input, indexed by absolute offsets,
+    but only keeps a window in memory.
+    The window is refilled with ``chunk_size'' reads when the parser looks ahead
+    and the data before a cut point is discarded by ``release''.
+    """
+
+    def __init__(self, file, chunk_size=65536):
+        if not hasattr(file, 'read'):
+            raise ValueError, file # expecting a file object
+        if not (isinstance(chunk_size, int) and chunk_size > 0):
+            raise ValueError, chunk_size # expecting int > 0
+        object.__init__(self)
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.base = 0 # offset of buffer[0]
+        self.eof = False
+
+    def fill(self, stop):
+        r""" Reads until the window reaches ``stop'' or the end of the file.
+
+        Returns False if there is no more data to read.
+        """
+        _chunks = [self.buffer]
+        _end = self.base + len(self.buffer)
+        while _end < stop and not self.eof:
+            _chunk = self.file.read(self.chunk_size)
+            if not _chunk:
+                self.eof = True
+                break
+            _chunks.append(_chunk)
+            _end += len(_chunk)
+        if len(_chunks) > 1:
+            self.buffer = ''.join(_chunks)
+            return True
+        return False
+
+    def release(self, offset):
+        r""" Discards the data before ``offset''. """
+        _n = offset - self.base
+        if _n >= self.chunk_size: # amortize the copy
+            self.buffer = self.buffer[_n:]
+            self.base = offset
+
+    def _index(self, offset):
+        _i = offset - self.base
+        if _i < 0:
+            raise IndexError, (offset, self.base,) # released
+        return _i
+
+    def __getitem__(self, offset):
+        _i = self._index(offset)
+        if _i >= len(self.buffer):
+            self.fill(offset + 1)
+        return self.buffer[_i]
+
+    def __getslice__(self, start, stop):
+        _i = self._index(start)
+        if stop > self.base + len(self.buffer):
+            self.fill(stop)
+        return self.buffer[_i:stop - self.base]
+
+    def startswith(self, s, offset):
+        _i = self._index(offset)
+        if offset + len(s) > self.base + len(self.buffer):
+            self.fill(offset + len(s))
+        return self.buffer.startswith(s, _i)
+
+    def find(self, s, offset, stop=None):
+        r""" Returns the offset of the next ``s'' or -1.
+
+        If ``stop'' is provided ``s'' must end before it, nothing after it is read.
+        """
+        _start = self._index(offset)
+        if stop is not None:
+            if stop > self.base + len(self.buffer):
+                self.fill(stop)
+            _i = self.buffer.find(s, _start, stop - self.base)
+            if _i < 0:
+                return -1 # not found
+            return self.base + _i
+        while True:
+            _i = self.buffer.find(s, _start)
+            if _i >= 0:
+                return self.base + _i
+            _start = max(_start, len(self.buffer) - len(s) + 1)
+            if not self.fill(self.base + len(self.buffer) + 1):
+                return -1
+
+    def match_end(self, regex, offset):
+        r""" Returns the offset where a ``CharClass'' scan that starts at ``offset'' ends. """
+        _start = self._index(offset)
+        while True:
+            _end = regex.match(self.buffer, _start).end()
+            if _end < len(self.buffer):
+                return self.base + _end
+            if not self.fill(self.base + _end + 1):
+                return self.base + _end
+            _start = _end # character class scans can resume where they stopped
+# ssalc StreamBuffer
+
+
+class FeedBuffer(StreamBuffer):
+    r""" Input buffer that is filled by ``ParserSkeleton.feed''.
+
+    Looking past the fed data before ``close'' sets ``starved'',
+    the parser cannot know yet what follows.
+    ``failure'' is a ``ParseError'' that waits for the results before it to be returned.
+    """
+
+    def __init__(self, data='', chunk_size=65536):
+        if not isinstance(data, str):
+            raise ValueError, type(data) # expecting str
+        if not (isinstance(chunk_size, int) and chunk_size > 0):
+            raise ValueError, chunk_size # expecting int > 0
+        object.__init__(self)
+        self.file = None
+        self.chunk_size = chunk_size
+        self.buffer = data
+        self.base = 0 # offset of buffer[0]
+        self.eof = False
+        self.starved = False
+        self.failure = None
+
+    def fill(self, stop):
+        r""" There is nothing to read, records that the parser wanted more. """
+        if not self.eof and self.base + len(self.buffer) < stop:
+            self.starved = True
+        return False
+
+    def append(self, chunk):
+        r""" Adds ``chunk'' to the end of the data. """
+        if self.eof:
+            raise RuntimeError, 'closed' # expecting more data before close
+        if not isinstance(chunk, str):
+            raise ValueError, type(chunk) # expecting str
+        self.buffer += chunk
+
+    def close(self):
+        r""" Marks the end of the data. """
+        self.eof = True
+
+    def end(self):
+        r""" Returns the offset of the end of the fed data. """
+        return self.base + len(self.buffer)
+# ssalc FeedBuffer
+
+
+class EditBuffer(StreamBuffer):
+    r""" Input buffer of ``ParserSkeleton.incremental'', the whole str that ``edit'' changes.
+
+    ``examined'' is the end of the furthest data that was read (the end of the data counts),
+    it tells which data a memoized result depends on.
+    """
+
+    def __init__(self, data):
+        if not isinstance(data, str):
+            raise ValueError, type(data) # expecting str
+        object.__init__(self)
+        self.file = None
+        self.chunk_size = 65536
+        self.buffer = data
+        self.base = 0 # never released, cut points are disabled
+        self.eof = True
+        self.examined = 0
+
+    def __getitem__(self, offset):
+        if offset >= self.examined:
+            self.examined = offset + 1
+        return StreamBuffer.__getitem__(self, offset)
+
+    def __getslice__(self, start, stop):
+        if stop > self.examined:
+            self.examined = stop
+        return StreamBuffer.__getslice__(self, start, stop)
+
+    def startswith(self, s, offset):
+        if offset + len(s) > self.examined:
+            self.examined = offset + len(s)
+        return StreamBuffer.startswith(self, s, offset)
+
+    def find(self, s, offset, stop=None):
+        _i = StreamBuffer.find(self, s, offset, stop)
+        if _i >= 0:
+            _end = _i + len(s)
+        elif stop is not None:
+            _end = stop
+        else:
+            _end = len(self.buffer) + 1 # read to the end of the data
+        if _end > self.examined:
+            self.examined = _end
+        return _i
+
+    def match_end(self, regex, offset):
+        _end = StreamBuffer.match_end(self, regex, offset)
+        if _end + 1 > self.examined:
+            self.examined = _end + 1 # the character that ended the scan was read
+        return _end
+# ssalc EditBuffer
+
+
+class LineIndex(object):
+    r""" Index of the newline offsets of the data, maps offsets to (line, column).
+
+    The index is built lazily, ``scan'' only reads the data before the requested offset,
+    and the lookups are a binary search (``bisect'') over an ``array('l')''.
+    """
+
+    def __init__(self, data):
+        object.__init__(self)
+        self.data = data
+        self.newlines = array('l')
+        self.scanned = 0 # the newlines before this offset are indexed
+
+    def scan(self, stop):
+        r""" Indexes the newlines before ``stop''. """
+        _i = self.scanned
+        if stop <= _i:
+            return
+        _find = self.data.find
+        _newlines = self.newlines
+        while True:
+            _i = _find('\n', _i, stop)
+            if _i < 0:
+                break # no more newlines before stop
+            _newlines.append(_i)
+            _i += 1
+        self.scanned = stop
+
+    def line(self, offset):
+        r""" Returns the line of ``offset'', starting at 1. """
+        self.scan(offset)
+        return bisect_left(self.newlines, offset) + 1
+
+    def position(self, offset):
+        r""" Returns the (line, column) of ``offset'', both start at 1. """
+        self.scan(offset)
+        _n = bisect_left(self.newlines, offset)
+        if _n == 0:
+            return (1, offset + 1,)
+        return (_n + 1, offset - self.newlines[_n - 1],)
+# ssalc LineIndex
+
+
+class Choice(object):
+    r""" Ordered choice with first character dispatch for ``ParserSkeleton.choice''.
+
+    ``alternatives'' are (first, name) pairs in order of preference.
+    ``name'' is the name of a parser method.
+    ``first'' is the set of characters the method can start with,
+    a string or a ``CharClass'', or ``None'' for any character and end of data.
+
+    The alternatives that can start with a lookahead character are
+    computed the first time that character is seen and then cached.
+
+    ``name'' (keyword) is the public rule or token name that is expected when
+    no alternative matches, private alternatives (``_'' prefix) are never reported.
+    """
+
+    def __init__(self, *alternatives, **kwargs):
+        name = kwargs.pop('name', None)
+        if kwargs:
+            raise ValueError, kwargs # unexpected keyword arguments
+        if not (name is None or isinstance(name, str)):
+            raise ValueError, name # expecting None or str
+        object.__init__(self)
+        for _first, _name in alternatives:
+            if not (_first is None or isinstance(_first, (str, CharClass))):
+                raise ValueError, _first # expecting None, str or CharClass
+            if not isinstance(_name, str):
+                raise ValueError, _name # expecting str
+        self.alternatives = tuple(alternatives)
+        self.name = name
+        self.table = {} # lookahead -> (name, ...)
+
+    def candidates(self, c):
+        r""" Returns the names of the alternatives that can start with ``c'' in order. """
+        _names = self.table.get(c)
+        if _names is None:
+            _names = []
+            for _first, _name in self.alternatives:
+                if _first is None:
+                    _names += [_name]
+                elif c is not None and c in _first:
+                    _names += [_name]
+            _names = tuple(_names)
+            self.table[c] = _names
+        return _names
+# ssalc Choice
+
+
+class Memo(object):
+    r""" Packrat memo table for ``ParserSkeleton.memoize''.
+
+    Maps (rule name, start snapshot, arguments) to the outcome of the rule,
+    which is the result and end snapshot or the failure.
+
+    Eviction policies:
+     * ``size'' - keep at most ``size'' entries, the least recently used is evicted first
+     * ``window'' - evict entries that start more than ``window'' positions behind the furthest start
+
+    ``hits'', ``misses'' and ``evictions'' count what happened to the table.
+    """
+
+    def __init__(self, size=None, window=None):
+        if size is not None and not (isinstance(size, int) and size > 0):
+            raise ValueError, size # expecting None or int > 0
+        if window is not None and not (isinstance(window, int) and window >= 0):
+            raise ValueError, window # expecting None or int >= 0
+        object.__init__(self)
+        self.size = size
+        self.window = window
+        self.entries = OrderedDict() # key -> outcome
+        self.positions = {} # offset -> [key, ...]
+        self.low = 0 # positions below are evicted
+        self.furthest = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        r""" Removes all the entries, the counters keep counting. """
+        self.entries.clear()
+        self.positions.clear()
+        self.low = 0
+        self.furthest = 0
+
+    def get(self, key):
+        r""" Returns the outcome of ``key'' or ``None''. """
+        _outcome = self.entries.get(key)
+        if _outcome is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.size is not None:
+            # most recently used goes to the end
+            del self.entries[key]
+            self.entries[key] = _outcome
+        return _outcome
+
+    def put(self, key, offset, outcome):
+        r""" Stores the ``outcome'' of ``key'' that starts at ``offset''. """
+        if offset < self.low:
+            return # already discarded
+        self.entries[key] = outcome
+        if self.window is not None:
+            if offset in self.positions:
+                self.positions[offset].append(key)
+            else:
+                self.positions[offset] = [key]
+            if offset > self.furthest:
+                self.furthest = offset
+                self.discard(offset - self.window)
+        if self.size is not None:
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, offset):
+        r""" Evicts the entries that start before ``offset''. """
+        if offset <= self.low:
+            return
+        if self.window is None:
+            # no position index, check every entry
+            for _key in [_key for _key in self.entries if _key[1][0] < offset]:
+                del self.entries[_key]
+                self.evictions += 1
+        elif offset - self.low > len(self.positions):
+            for _offset in [_offset for _offset in self.positions if _offset < offset]:
+                self._discard_position(_offset)
+        else:
+            for _offset in xrange(self.low, offset):
+                self._discard_position(_offset)
+        self.low = offset
+
+    def _discard_position(self, offset):
+        for _key in self.positions.pop(offset, ()):
+            if self.entries.pop(_key, None) is not None:
+                self.evictions += 1
+# ssalc Memo
+
+
+class _MemoRule(object):
+    r""" Memoized rule method of a parser. """
+
+    def __init__(self, parser, name, func):
+        object.__init__(self)
+        self.parser = parser
+        self.__name__ = name
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        _parser = self.parser
+        _memo = _parser.memo
+        _start = _parser.checkpoint()
+        _key = (self.__name__, _start, args, tuple(sorted(kwargs.items())),)
+        _outcome = _memo.get(_key)
+        if _outcome is None:
+            try:
+                _result = self.func(*args, **kwargs)
+            except AssertionError as _err:
+                _memo.put(_key, _start[0], (False, _err, None,))
+                raise
+            if _result is FAIL:
+                _memo.put(_key, _start[0], (False, FAIL, None,))
+            else:
+                _memo.put(_key, _start[0], (True, _result, _parser.checkpoint(),))
+            return _result
+        _ok, _result, _end = _outcome
+        if not _ok:
+            if _result is FAIL:
+                return FAIL
+            raise _result
+        _parser.restore(_end)
+        return _result
+# ssalc _MemoRule
+
+
+class _EditRule(_MemoRule):
+    r""" Memoized rule method of an incremental parser.
+
+    The outcome also records ``examined'' (see ``EditBuffer''), the end of the data the rule read.
+    """
+
+    def __call__(self, *args, **kwargs):
+        _parser = self.parser
+        _memo = _parser.memo
+        _data = _parser.state.data
+        _start = _parser.checkpoint()
+        _key = (self.__name__, _start, args, tuple(sorted(kwargs.items())),)
+        _outcome = _memo.get(_key)
+        if _outcome is None:
+            _outer = _data.examined
+            _data.examined = _start[0]
+            try:
+                _result = self.func(*args, **kwargs)
+            except AssertionError as _err:
+                _memo.put(_key, _start[0], (False, _err, None, _data.examined,))
+                raise
+            finally:
+                _examined = _data.examined
+                _data.examined = max(_outer, _examined)
+            if _result is FAIL:
+                _memo.put(_key, _start[0], (False, FAIL, None, _examined,))
+            else:
+                _memo.put(_key, _start[0], (True, _result, _parser.checkpoint(), _examined,))
+            return _result
+        _ok, _result, _end, _examined = _outcome
+        if _examined > _data.examined:
+            _data.examined = _examined
+        if not _ok:
+            if _result is FAIL:
+                return FAIL
+            raise _result
+        _parser.restore(_end)
+        return _result
+# ssalc _EditRule
+
+
+class BudgetExceeded(Exception):
+    r""" Raised when a parser exceeds its ``Budget''.
+
+    ``reason'' is 'steps', 'backtracks' or 'time',
+    ``offset'' is the furthest offset the parser reached.
+    Not an ``AssertionError'', so ``maybe'' does not mistake it for a parse error.
+    """
+
+    def __init__(self, reason, offset):
+        Exception.__init__(self, reason, offset)
+        self.reason = reason
+        self.offset = offset
+# ssalc BudgetExceeded
+
+
+class Budget(object):
+    r""" Limits the work of a parser, see ``ParserSkeleton.limit''.
+
+    ``steps'' is the maximum number of rule calls,
+    ``backtracks'' is the maximum number of restores to an earlier offset,
+    ``seconds'' is the wall-clock time, counted from ``start''.
+    ``None'' means no limit.
+    The clock is only read every ``CLOCK_STEPS'' rule calls.
+    """
+
+    CLOCK_STEPS = 256
+
+    def __init__(self, steps=None, backtracks=None, seconds=None, clock=time):
+        if steps is not None and not (isinstance(steps, int) and steps >= 0):
+            raise ValueError, steps # expecting int >= 0
+        if backtracks is not None and not (isinstance(backtracks, int) and backtracks >= 0):
+            raise ValueError, backtracks # expecting int >= 0
+        if seconds is not None and not (isinstance(seconds, (int, float)) and seconds >= 0):
+            raise ValueError, seconds # expecting number >= 0
+        object.__init__(self)
+        self.max_steps = steps
+        self.max_backtracks = backtracks
+        self.seconds = seconds
+        self.clock = clock
+        self.steps = 0
+        self.backtracks = 0
+        self.furthest = 0
+        self.deadline = None
+        self.exceeded = None # reason
+
+    def start(self):
+        r""" Starts counting the time. """
+        if self.seconds is not None:
+            self.deadline = self.clock() + self.seconds
+
+    def reset(self):
+        r""" Clears the counters and starts counting the time again. """
+        self.steps = 0
+        self.backtracks = 0
+        self.furthest = 0
+        self.exceeded = None
+        self.start()
+
+    def step(self, offset):
+        r""" Counts a rule call at ``offset''. """
+        if offset > self.furthest:
+            self.furthest = offset
+        self.steps += 1
+        if self.exceeded is not None:
+            raise BudgetExceeded(self.exceeded, self.furthest)
+        if self.max_steps is not None and self.steps > self.max_steps:
+            self.exceeded = 'steps'
+            raise BudgetExceeded(self.exceeded, self.furthest)
+        if self.deadline is not None and self.steps % self.CLOCK_STEPS == 0 and self.clock() > self.deadline:
+            self.exceeded = 'time'
+            raise BudgetExceeded(self.exceeded, self.furthest)
+
+    def backtrack(self, offset):
+        r""" Counts a restore from ``offset'' to an earlier offset.
+
+        Restores are allowed after the budget is exceeded, they revert the parser while it stops.
+        """
+        if offset > self.furthest:
+            self.furthest = offset
+        self.backtracks += 1
+        if self.exceeded is None and self.max_backtracks is not None and self.backtracks > self.max_backtracks:
+            self.exceeded = 'backtracks'
+            raise BudgetExceeded(self.exceeded, self.furthest)
+# ssalc Budget
+
+
+class _BudgetRule(object):
+    r""" Rule method of a parser that counts against a ``Budget''. """
+
+    def __init__(self, parser, name, func):
+        object.__init__(self)
+        self.parser = parser
+        self.__name__ = name
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        _parser = self.parser
+        _parser.budget.step(_parser.state.offset)
+        return self.func(*args, **kwargs)
+# ssalc _BudgetRule
+
+
+class RuleStats(object):
+    r""" Statistics of a rule method, see ``Profile''.
+
+    ``inclusive'' time includes the rules it called, ``exclusive'' time does not.
+    ``consumed'' is the number of characters consumed by the successful calls.
+    ``restores'' counts the state restores while it was the innermost rule.
+    """
+
+    COLUMNS = ('calls', 'ok', 'failed', 'consumed', 'inclusive', 'exclusive', 'restores',)
+
+    def __init__(self, name):
+        object.__init__(self)
+        self.name = name
+        self.calls = 0
+        self.ok = 0
+        self.failed = 0
+        self.consumed = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        self.restores = 0
+
+    def __repr__(self):
+        _s = ["RuleStats(", repr(self.name)]
+        for _k in self.COLUMNS:
+            _s += [", ", _k, "=", repr(getattr(self, _k))]
+        _s += [")"]
+        return ''.join(_s)
+# ssalc RuleStats
+
+
+class Profile(object):
+    r""" Per-rule profile of a parser, see ``ParserSkeleton.profile''. """
+
+    def __init__(self, clock=time):
+        object.__init__(self)
+        self.clock = clock
+        self.rules = {} # name -> RuleStats
+        self.active = [] # RuleStats of the running rules
+        self.children = [] # time spent in the rules they called
+        self.top = RuleStats(None) # restores outside of rules
+
+    def stats(self, name):
+        r""" Returns the ``RuleStats'' of ``name''. """
+        _stats = self.rules.get(name)
+        if _stats is None:
+            _stats = RuleStats(name)
+            self.rules[name] = _stats
+        return _stats
+
+    def sorted(self, key='exclusive'):
+        r""" Returns the ``RuleStats'' sorted by ``key'', most costly first. """
+        if key not in RuleStats.COLUMNS:
+            raise ValueError, key # expecting a RuleStats column
+        return sorted(self.rules.values(), key=lambda _stats: getattr(_stats, key), reverse=True)
+
+    def report(self, key='exclusive', limit=None):
+        r""" Returns a text table of the rules sorted by ``key''. """
+        _lines = ['%-32s %9s %9s %9s %9s %10s %10s %9s' % (('rule',) + RuleStats.COLUMNS)]
+        for _stats in self.sorted(key)[:limit]:
+            _lines += ['%-32s %9d %9d %9d %9d %10.6f %10.6f %9d' % (
+                _stats.name, _stats.calls, _stats.ok, _stats.failed, _stats.consumed,
+                _stats.inclusive, _stats.exclusive, _stats.restores,
+            )]
+        return '\n'.join(_lines)
+# ssalc Profile
+
+
+class _ProfileRule(object):
+    r""" Rule method of a parser that records ``RuleStats''. """
+
+    def __init__(self, parser, name, func):
+        object.__init__(self)
+        self.parser = parser
+        self.__name__ = name
+        self.func = func
+        self.stats = parser.profiler.stats(name)
+
+    def __call__(self, *args, **kwargs):
+        _profile = self.parser.profiler
+        _stats = self.stats
+        _state = self.parser.state
+        _clock = _profile.clock
+        _stats.calls += 1
+        _offset = _state.offset
+        _profile.active.append(_stats)
+        _profile.children.append(0.0)
+        _t = _clock()
+        try:
+            _result = self.func(*args, **kwargs)
+        except AssertionError:
+            _stats.failed += 1
+            raise
+        finally:
+            _t = _clock() - _t
+            _profile.active.pop()
+            _stats.inclusive += _t
+            _stats.exclusive += _t - _profile.children.pop()
+            if _profile.children:
+                _profile.children[-1] += _t
+        if _result is FAIL:
+            _stats.failed += 1
+        else:
+            _stats.ok += 1
+            _stats.consumed += _state.offset - _offset
+        return _result
+# ssalc _ProfileRule
+
+
+class _ProfileRestore(object):
+    r""" ``restore'' method of a parser that counts the restores of the running rule. """
+
+    def __init__(self, parser, func):
+        object.__init__(self)
+        self.parser = parser
+        self.func = func
+
+    def __call__(self, snapshot):
+        _profile = self.parser.profiler
+        if _profile.active:
+            _profile.active[-1].restores += 1
+        else:
+            _profile.top.restores += 1
+        return self.func(snapshot)
+# ssalc _ProfileRestore
+
+
+class Heatmap(object):
+    r""" Histogram of the input offsets that were parsed again, see ``ParserSkeleton.heatmap''.
+
+    A restore from offset ``stop'' back to offset ``start'' counts one visit
+    of the offsets in [start, stop), that work is discarded and done again.
+    The visits are stored in a difference array (``array('l')''),
+    so recording a restore does not depend on the size of the range.
+    """
+
+    def __init__(self):
+        object.__init__(self)
+        self.delta = array('l')
+        self.restores = 0
+
+    def add(self, start, stop):
+        r""" Counts a visit of the offsets in [start, stop). """
+        if stop <= start:
+            return # not backwards
+        _delta = self.delta
+        if stop >= len(_delta):
+            _delta.extend([0] * (max(stop + 1, 2 * len(_delta)) - len(_delta))) # amortize growth
+        _delta[start] += 1
+        _delta[stop] -= 1
+        self.restores += 1
+
+    def counts(self):
+        r""" Returns an ``array('L')'' with the number of visits of each offset. """
+        _counts = array('L')
+        _n = 0
+        for _d in self.delta:
+            _n += _d
+            _counts.append(_n)
+        while _counts and _counts[-1] == 0:
+            _counts.pop()
+        return _counts
+
+    def lines(self, data):
+        r""" Returns an ``array('L'') with the visits of each line of ``data'', line 1 at index 0. """
+        _lines = array('L', [0])
+        _counts = self.counts()
+        _end = data.find('\n')
+        for _offset in xrange(len(_counts)):
+            while 0 <= _end < _offset:
+                _lines.append(0)
+                _end = data.find('\n', _end + 1)
+            _lines[-1] += _counts[_offset]
+        return _lines
+
+    def dump(self, file):
+        r""" Writes the visits of each offset to ``file'' (native 'L' items, see ``load''). """
+        file.write(self.counts().tostring())
+
+    @staticmethod
+    def load(file):
+        r""" Reads the visits of each offset written by ``dump''. """
+        _counts = array('L')
+        _counts.fromstring(file.read())
+        return _counts
+
+    def report(self, data=None, limit=10):
+        r""" Returns a text report with the most visited offsets, or lines if ``data'' is provided. """
+        if data is None:
+            _unit = 'offset'
+            _counts = self.counts()
+            _base = 0
+        else:
+            _unit = 'line'
+            _counts = self.lines(data)
+            _base = 1
+        _top = sorted([(_n, _i + _base,) for _i, _n in enumerate(_counts) if _n > 0], reverse=True)[:limit]
+        _lines = ['%d restores, %d %ss visited again' % (self.restores, len([_n for _n in _counts if _n > 0]), _unit,)]
+        _scale = max([1] + [_n for _n, _i in _top])
+        for _n, _i in _top:
+            _lines += ['%-6s %9d %9d %s' % (_unit, _i, _n, '#' * (1 + 39 * _n // _scale),)]
+        return '\n'.join(_lines)
+# ssalc Heatmap
+
+
+class _HeatmapRestore(object):
+    r""" ``restore'' method of a parser that records a ``Heatmap''. """
+
+    def __init__(self, parser, func):
+        object.__init__(self)
+        self.parser = parser
+        self.func = func
+
+    def __call__(self, snapshot):
+        _state = self.parser.state
+        _stop = _state.offset
+        _result = self.func(snapshot)
+        self.parser.heatmapper.add(_state.offset, _stop)
+        return _result
+# ssalc _HeatmapRestore
 
 
 class ParserSkeleton(object):
@@ -199,45 +1112,182 @@ class ParserSkeleton(object):
 
     It does not parse by itself.
 
+    Rules signal failure in one of two ways:
+     * return ``FAIL'', the state is reverted by the caller
+     * raise ``AssertionError'', usually with ``assert'' (requires assertions, does not work with ``python -O'')
+
     TODO several states/paths at the same time?
     """
 
     class State:
-        def __init__(self, data):
+        r""" Position of the parser in the immutable input buffer.
+
+        ``_fields'' names the scalar attributes that are captured by
+        ``snapshot'' and put back by ``restore''.
+        Subclasses that add attributes must extend it.
+        """
+        _fields = ('offset', 'events',)
+        def __init__(self, data, offset=0):
             self.data = data
+            self.offset = offset
+            self.events = 0 # number of events emitted in event mode
+        def snapshot(self):
+            r""" Returns a tuple with the values of ``_fields''. """
+            return tuple([getattr(self, _k) for _k in self._fields])
+        def restore(self, snapshot):
+            r""" Puts back the values of a ``snapshot''. """
+            for _k, _v in zip(self._fields, snapshot):
+                setattr(self, _k, _v)
         def __repr__(self):
-            _s = ["ParserSkeleton.State(", repr(self.data), ")"]
+            # never the whole data, it can be huge
+            _s = ["ParserSkeleton.State(<", type(self.data).__name__, ">, ", repr(self.offset), ")"]
             return ''.join(_s)
     # ssalc State
 
-    def __init__(self, data=''):
-        if not isinstance(data, str):
-            raise ValueError, type(data) # expecting str # TODO other types
+    RULE_PREFIXES = ('rule_', 'token_', 'byte_',)
+
+    FEED_RULE = None # name of the rule that ``feed'' calls for each top-level result
+    FEED_TAIL = None # name of the rule that ``close'' calls after the last result, the rest must be ignorable
+
+    def __init__(self, data='', offset=0):
+        r""" ``data'' is a str, unicode, bytearray, memoryview, ``StrView'', ``mmap'', ``StreamBuffer'' or a file object.
+
+        A ``mmap'' is used in place, bytearray and memoryview are used in place through a ``StrView''.
+        Only consumed data is copied.
+        """
+        _buffer = self._buffer(data)
+        if not isinstance(offset, int):
+            raise ValueError, offset # expecting int
         object.__init__(self)
         self.data = data
-        self.state = self.State(data) # TODO strview or similar in the state
+        self.state = self.State(_buffer, offset)
         self.stack = []
+        self.memo = None
+        self.cut = offset
+        self.cuts = True
+        self.handler = None
+        self.pending = [] # events that are not final
+        self.flushed = 0 # number of events delivered
+        self.validating = False
+        self.spans = False # nodes record their text with ``source''
+        self.budget = None
+        self.profiler = None
+        self.heatmapper = None
+        self.furthest = offset # furthest offset of a failure
+        self.index = None # LineIndex
+        self.expected = [] # what was expected at the furthest offset
+
+    def _buffer(self, data):
+        if isinstance(data, (basestring, mmap, StreamBuffer, StrView)):
+            return data
+        if isinstance(data, (bytearray, memoryview)):
+            return StrView(data)
+        if hasattr(data, 'read'):
+            return StreamBuffer(data)
+        raise ValueError, type(data) # expecting a string-like object or file
+
+    def reset(self, data='', offset=0):
+        r""" Starts again with ``data'', like a new parser but the instance is reused.
+
+        The ``State'', the stack, the memo table (see ``memoize'') and the wrapped rule methods are reused.
+        The memo entries are removed and the budget (see ``limit'') starts again.
+        The profile and heatmap counters keep counting and the handler (see ``listen'') stays.
+        An incremental parser (see ``incremental'') needs str data.
+        """
+        _buffer = self._buffer(data)
+        if not isinstance(offset, int):
+            raise ValueError, offset # expecting int
+        if isinstance(self.state.data, EditBuffer):
+            if not isinstance(_buffer, str):
+                raise ValueError, type(_buffer) # expecting str data
+            _buffer = EditBuffer(_buffer)
+        self.data = data
+        self.state.__init__(_buffer, offset)
+        del self.stack[:]
+        if self.memo is not None:
+            self.memo.clear()
+        self.cut = offset
+        del self.pending[:]
+        self.flushed = 0
+        self.validating = False
+        if self.budget is not None:
+            self.budget.reset()
+        self.furthest = offset
+        self.index = None
+        del self.expected[:]
 
     def __getitem__(self, index, *args, **kwargs):
-        """ Gets data or ``None''. """
+        """ Gets data relative to the offset or ``None''. """
         try:
-            return self.state.data[index]
+            return self.state.data[self.state.offset + index]
         except IndexError:
             return None # implicit None
 
     def __getslice__(self, start, stop, *args, **kwargs):
-        """ Gets data or ``None''. """
+        """ Gets data relative to the offset or ``None''. """
+        _offset = self.state.offset
         try:
-            return self.state.data[start:stop]
+            return self.state.data[_offset + start:_offset + stop]
         except IndexError:
             return None # implicit None
 
+    def checkpoint(self):
+        r""" Returns a snapshot of the parser state. """
+        return self.state.snapshot()
+
+    def restore(self, snapshot):
+        r""" Reverts the parser state to a ``snapshot''.
+
+        Raises ``CutError'' if the snapshot was dropped by ``commit''.
+        """
+        if snapshot is None or snapshot[0] < self.cut:
+            raise CutError, (self.cut, snapshot,) # cannot backtrack past the cut point
+        _offset = self.state.offset
+        self.state.restore(snapshot)
+        if self.budget is not None and snapshot[0] < _offset:
+            self.budget.backtrack(_offset)
+        if self.handler is not None:
+            del self.pending[self.state.events - self.flushed:] # reverted events
+
+    def commit(self):
+        r""" Cut point, the parser will not backtrack to before the offset.
+
+        Drops the saved states, evicts the memo entries that start before
+        the offset, delivers the pending events and releases the input before the offset.
+        Does nothing if ``cuts'' is false.
+        """
+        if not self.cuts:
+            return
+        _offset = self.state.offset
+        self.cut = _offset
+        _stack = self.stack
+        for _i in xrange(len(_stack)):
+            _stack[_i] = None
+        if self.memo is not None:
+            self.memo.discard(_offset)
+        if self.handler is not None:
+            self.flush()
+        if self.furthest < _offset:
+            self.furthest = _offset
+            del self.expected[:]
+        self.release(_offset)
+
+    def release(self, offset):
+        r""" Allows the input before ``offset'' to be released.
+
+        Only streamed input is released, see ``StreamBuffer''.
+        The newlines before ``offset'' are indexed first (see ``line_index'').
+        """
+        _data = self.state.data
+        if isinstance(_data, StreamBuffer):
+            self.line_index().scan(offset)
+            _data.release(offset)
+
     def __enter__(self, *args, **kwargs):
         r""" Save parser state. """
         if not isinstance(self, ParserSkeleton):
             raise RuntimeError, type(self) # expecting ParserSkeleton
-        self.stack += [self.state]
-        self.state = deepcopy(self.state)
+        self.stack.append(self.checkpoint())
 
     def __exit__(self, exc_type, exc_value, traceback):
         r""" Keep or revert parser state. """
@@ -245,51 +1295,1236 @@ class ParserSkeleton(object):
             raise RuntimeError, type(self) # expecting ParserSkeleton
         if not len(self.stack) > 0:
             raise RuntimeError, len(self.stack) # expecting a non-empty stack
-        _state = self.stack.pop(-1)
+        _snapshot = self.stack.pop(-1)
         if exc_type is None and exc_value is None and traceback is None:
             # all ok, forget previous state
             pass
         else:
             # has exception, revert to previous position and propagate exception
-            self.state = _state
+            self.restore(_snapshot)
 
     def consume(self, n, *args, **kwargs):
-        r""" Consumes state data. """
+        r""" Consumes state data.
+
+        Only the offset moves, the input buffer is never copied.
+        """
         if not isinstance(n, int):
             raise ValueError, n # expecting int
         if not n >= 0:
             raise ValueError, n # expecting >= 0
-        _consumed = self.state.data[:n]
-        self.state.data = self.state.data[n:]
+        _offset = self.state.offset
+        _consumed = self.state.data[_offset:_offset + n]
+        self.state.offset = _offset + len(_consumed)
         return _consumed
 
+    def source(self, start, stop=None):
+        r""" Returns the data from ``start'' to ``stop'' (defaults to the offset).
+
+        The text is a ``StrView'' of the input, only the offsets are stored
+        and ``str(view)'' materializes it.
+        Streamed input is released at cut points, so its text is copied instead.
+        """
+        if stop is None:
+            stop = self.state.offset
+        _data = self.state.data
+        if isinstance(_data, EditBuffer):
+            return StrView(_data.buffer, start, stop)
+        if isinstance(_data, StreamBuffer):
+            return _data[start:stop]
+        return StrView(_data, start, stop)
+
     def starts_with(self, s):
-        r""" TODO """
-        if not isinstance(s, str):
+        r""" Checks if the data at the offset starts with ``s''. """
+        if not isinstance(s, basestring):
             raise ValueError, (s,) # expecting str
-        for _i, _c in enumerate(s):
-            if self[_i] != _c:
-                return False # does not match
+        _data = self.state.data
+        _offset = self.state.offset
+        if isinstance(_data, mmap):
+            return _data[_offset:_offset + len(s)] == s # no startswith
+        return _data.startswith(s, _offset)
+
+    def span(self, charclass, start=0):
+        r""" Returns the number of characters at ``start'' that belong to ``charclass''.
+
+        ``start'' is relative to the offset.
+        """
+        _offset = self.state.offset + start
+        _data = self.state.data
+        if isinstance(_data, (StreamBuffer, StrView)):
+            return _data.match_end(charclass.span_re, _offset) - _offset
+        return charclass.span_re.match(_data, _offset).end() - _offset
+
+    def span_until(self, charclass, start=0):
+        r""" Returns the number of characters at ``start'' that do not belong to ``charclass''.
+
+        ``start'' is relative to the offset.
+        """
+        _offset = self.state.offset + start
+        _data = self.state.data
+        if isinstance(_data, (StreamBuffer, StrView)):
+            return _data.match_end(charclass.until_re, _offset) - _offset
+        return charclass.until_re.match(_data, _offset).end() - _offset
+
+    def find(self, s, start=0):
+        r""" Returns the distance from ``start'' to the next ``s'' or -1.
+
+        ``start'' is relative to the offset.
+        """
+        _offset = self.state.offset + start
+        _index = self.state.data.find(s, _offset)
+        if _index < 0:
+            return -1 # not found
+        return _index - _offset
+
+    def choice(self, choice, *args, **kwargs):
+        r""" Tries the alternatives of ``choice'' that can start with the lookahead character.
+
+        The alternatives are called with the provided arguments like ``maybe''.
+        Returns the first result or ``FAIL'', then the ``name'' of ``choice'' is expected.
+        """
+        for _name in choice.candidates(self[0]):
+            _result = self.maybe(getattr(self, _name), *args, **kwargs)
+            if _result is not None:
+                return _result
+        if choice.name is not None:
+            return self.fail(choice.name)
+        return FAIL
+
+    def match(self, expr):
+        r""" Matches a combinator expression at the offset.
+
+        Returns the value or ``FAIL''.
+        Only the offset is updated, see ``pyparse.parser.combinator''.
+        """
+        _data = self.state.data
+        _r = expr.compiled(not isinstance(_data, basestring))(_data, self.state.offset)
+        if _r is FAIL:
+            return FAIL
+        self.state.offset = _r[1]
+        return _r[0]
+
+    def feed(self, chunk):
+        r""" Pushes a chunk of input and returns the ``FEED_RULE'' results that became final.
+
+        A result is final when the rule accepted it without looking past the fed data.
+        Otherwise the attempt is reverted and tried again with the next chunk,
+        so the rule resumes from the last top-level result (the cut point).
+        The data is converted to a ``FeedBuffer'' on the first call.
+        """
+        self._feed_buffer().append(chunk)
+        return self._feed_results()
+
+    def close(self):
+        r""" Marks the end of the input and returns the remaining ``FEED_RULE'' results.
+
+        At the end of the input a ``FAIL'' ends the results, then ``FEED_TAIL'' (if any) consumes
+        what can be ignored, like the blank lines at the end of a file.
+        Any input that is left is not well formed and ``error'' is raised,
+        the results of this call are discarded with it.
+        A ``FAIL'' that was final before the end of the input is raised here if ``feed'' did not.
+        """
+        self._feed_buffer().close()
+        return self._feed_results()
+
+    def feed_iter(self, source, chunk_size=65536):
+        r""" Generator that feeds the chunks of ``source'' and yields the ``FEED_RULE'' results.
+
+        ``source'' is an iterable of str chunks or a file object (read ``chunk_size'' at a time).
+        The parse work happens between chunks, so an event loop that drives
+        the generator only waits for the parser one chunk at a time.
+        """
+        if hasattr(source, 'read'):
+            _read = source.read
+            source = iter(lambda: _read(chunk_size), '')
+        for _chunk in source:
+            for _result in self.feed(_chunk):
+                yield _result
+        for _result in self.close():
+            yield _result
+
+    def _feed_buffer(self):
+        _data = self.state.data
+        if isinstance(_data, FeedBuffer):
+            return _data
+        if self.FEED_RULE is None:
+            raise RuntimeError, type(self) # expecting FEED_RULE
+        if not isinstance(_data, str):
+            raise RuntimeError, type(_data) # expecting str data or a FeedBuffer
+        _data = FeedBuffer(_data)
+        self.state.data = _data
+        self.index = None # data changed
+        return _data
+
+    def _feed_results(self):
+        _data = self.state.data
+        if _data.failure is not None:
+            raise _data.failure # the results before it were returned
+        _rule = getattr(self, self.FEED_RULE)
+        _results = []
+        while self.state.offset < _data.end():
+            _snapshot = self.checkpoint()
+            _failure = (self.furthest, list(self.expected),)
+            _data.starved = False
+            _cuts = self.cuts
+            self.cuts = False # the rule might need to be tried again
+            try:
+                _result = _rule()
+            except Exception as _err:
+                self.cuts = _cuts
+                if not _data.starved or isinstance(_err, BudgetExceeded):
+                    raise # error is final
+                _result = FAIL
+            self.cuts = _cuts
+            if _data.starved:
+                self.restore(_snapshot) # wait for more data
+                self.furthest, self.expected = _failure # failures at the end of the fed data are not final
+                if self.memo is not None:
+                    self.memo.clear() # entries might depend on the missing data
+                break
+            if _result is FAIL:
+                if _data.eof:
+                    if self.FEED_TAIL is not None:
+                        getattr(self, self.FEED_TAIL)()
+                    if self.state.offset < _data.end():
+                        raise self.error() # expecting FEED_RULE or FEED_TAIL
+                    break # no more results
+                if _results:
+                    _data.failure = self.error() # return the final results first
+                    break
+                raise self.error() # expecting FEED_RULE
+            _results.append(_result)
+            self.commit()
+            if self.state.offset == _snapshot[0]:
+                break # did not consume anything
+        return _results
+
+    def listen(self, handler):
+        r""" Enables event mode, rules report to ``handler'' instead of building nodes.
 
-        return True # matches
+        Rules that support it call ``start'', ``end'' and ``token''.
+        The events are delivered at cut points (see ``commit'') or by ``flush''.
+        Event mode cannot be combined with ``memoize'', a memo hit would skip the events.
+        """
+        if not isinstance(handler, Handler):
+            raise ValueError, type(handler) # expecting Handler
+        if self.memo is not None:
+            raise RuntimeError, self.memo # memoized
+        self.handler = handler
+        self.flushed = self.state.events
+        return handler
+
+    def start(self, name):
+        r""" Emits the start of a ``name'' node. """
+        self.pending.append((0, name, None,))
+        self.state.events += 1
+
+    def end(self, name):
+        r""" Emits the end of a ``name'' node. """
+        self.pending.append((1, name, None,))
+        self.state.events += 1
+
+    def token(self, name, value):
+        r""" Emits a ``name'' leaf. """
+        self.pending.append((2, name, value,))
+        self.state.events += 1
+
+    def flush(self):
+        r""" Delivers the pending events to the handler, they cannot be reverted after this. """
+        _handler = self.handler
+        _pending = self.pending
+        for _kind, _name, _value in _pending:
+            if _kind == 0:
+                _handler.start(_name)
+            elif _kind == 1:
+                _handler.end(_name)
+            else:
+                _handler.token(_name, _value)
+        self.flushed += len(_pending)
+        del _pending[:]
+
+    def building(self):
+        r""" Returns True if rules build result nodes, False in event mode or validation mode. """
+        return self.handler is None and not self.validating
+
+    def validate(self, name, *args, **kwargs):
+        r""" Checks that the data is well formed, according to the rule ``name''.
+
+        The rule runs in validation mode (see ``validating''), it is called like ``maybe''
+        until it fails or stops consuming data.
+        Rules that support validation mode skip building nodes and source text,
+        and no events are emitted.
+        Returns (True, offset) if all the data was accepted,
+        otherwise (False, offset) with the furthest offset of a failure (see ``fail'').
+        """
+        _rule = getattr(self, name)
+        _handler = self.handler
+        self.handler = None
+        self.validating = True
+        try:
+            while not self.at_end():
+                _offset = self.state.offset
+                if self.maybe(_rule, *args, **kwargs) is None:
+                    break # rejected
+                if self.state.offset == _offset:
+                    break # no progress
+        finally:
+            self.validating = False
+            self.handler = _handler
+        if self.at_end():
+            return (True, self.state.offset,)
+        return (False, max(self.furthest, self.state.offset),)
+
+    def fail(self, expected, start=0):
+        r""" Records that ``expected'' was not found at ``start'' and returns ``FAIL''.
+
+        ``start'' is relative to the offset.
+        ``expected'' should be a rule name or another interned string.
+        Only the furthest offset and what was expected there are kept, see ``error''.
+        """
+        _offset = self.state.offset + start
+        if _offset > self.furthest:
+            self.furthest = _offset
+            self.expected = [expected]
+        elif _offset == self.furthest and expected not in self.expected:
+            self.expected.append(expected)
+        return FAIL
+
+    def expecting(self, expected, start=0):
+        r""" Like ``fail'' but returns the offset, for assert messages.
+
+        ``assert condition, self.expecting(name)'' only records the failure if the condition is false.
+        """
+        self.fail(expected, start)
+        return self.state.offset + start
+
+    def line_index(self):
+        r""" Returns the ``LineIndex'' of the data, created on the first call. """
+        if self.index is None:
+            self.index = LineIndex(self.state.data)
+        return self.index
+
+    def line(self, offset=None):
+        r""" Returns the line of ``offset'', defaults to the offset of the parser. """
+        if offset is None:
+            offset = self.state.offset
+        return self.line_index().line(offset)
+
+    def position(self, offset):
+        r""" Returns the (line, column) of ``offset'', both start at 1. """
+        return self.line_index().position(offset)
+
+    def error(self):
+        r""" Returns a ``ParseError'' for the furthest failure, nothing is parsed again. """
+        _offset = self.furthest
+        _expected = self.expected
+        if _offset < self.state.offset:
+            _offset = self.state.offset
+            _expected = []
+        _line, _column = self.position(_offset)
+        return ParseError(_offset, _line, _column, tuple(_expected))
+
+    def parse(self, name, *args, **kwargs):
+        r""" Parses all the data with the rule ``name'' and returns the result.
+
+        Raises ``ParseError'' if the rule fails or does not consume all the data.
+        """
+        _result = self.maybe(getattr(self, name), *args, **kwargs)
+        if _result is None:
+            raise self.error()
+        if not self.at_end():
+            self.fail('end of data')
+            raise self.error()
+        return _result
+
+    def at_end(self):
+        r""" Returns True if there is no data at the offset. """
+        return ParserSkeleton.__getitem__(self, 0) is None
+
+    def rule_names(self):
+        r""" Returns the names of the rule methods (see ``RULE_PREFIXES''). """
+        return [_name for _name in dir(self) if _name.startswith(self.RULE_PREFIXES) and _name != 'rule_names']
+
+    def memoize(self, memo=None, names=None):
+        r""" Enables packrat memoization of rule methods.
+
+        ``memo'' is the ``Memo'' table to use, defaults to an unbounded one.
+        ``names'' selects the rule methods, defaults to ``rule_names()''.
+        Only this instance is affected, rule methods are wrapped on the instance.
+        With ``incremental'' input the wrappers also record what data each result depends on.
+        """
+        if memo is None:
+            memo = Memo()
+        if not isinstance(memo, Memo):
+            raise ValueError, type(memo) # expecting Memo
+        if self.memo is not None:
+            raise RuntimeError, self.memo # already memoized
+        if self.handler is not None:
+            raise RuntimeError, self.handler # event mode
+        if names is None:
+            names = self.rule_names()
+        self.memo = memo
+        if isinstance(self.state.data, EditBuffer):
+            _rule = _EditRule
+        else:
+            _rule = _MemoRule
+        for _name in names:
+            setattr(self, _name, _rule(self, _name, getattr(self, _name)))
+        return memo
+
+    def incremental(self, memo=None, names=None):
+        r""" Enables ``edit'', the rules are memoized (see ``memoize'') and reused after edits.
+
+        The data must be a str, it is converted to an ``EditBuffer''.
+        Cut points are disabled because the memo entries must outlive the parse,
+        so ``memo'' cannot have a ``window''.
+        Returns the ``Memo''.
+        """
+        _data = self.state.data
+        if not isinstance(_data, str):
+            raise ValueError, type(_data) # expecting str data
+        if memo is not None and memo.window is not None:
+            raise ValueError, memo.window # expecting no window
+        if self.memo is not None:
+            raise RuntimeError, self.memo # already memoized
+        self.state.data = EditBuffer(_data)
+        self.index = None # data changed
+        self.cuts = False
+        return self.memoize(memo, names)
+
+    def edit(self, start, old_len, new_text):
+        r""" Replaces ``old_len'' characters at ``start'' with ``new_text'', see ``incremental''.
+
+        The memo entries that did not read the replaced characters are kept.
+        The ones after them are moved, the result objects are the same and ``shift'' fixes their positions.
+        The parser goes back to the start, call the entry rule again to parse the new data.
+        """
+        _data = self.state.data
+        if not isinstance(_data, EditBuffer):
+            raise RuntimeError, type(_data) # expecting incremental
+        _buffer = _data.buffer
+        if not (isinstance(start, int) and self.cut <= start <= len(_buffer)):
+            raise ValueError, start # expecting an offset in the data
+        if not (isinstance(old_len, int) and 0 <= old_len <= len(_buffer) - start):
+            raise ValueError, old_len # expecting a length in the data
+        if not isinstance(new_text, str):
+            raise ValueError, type(new_text) # expecting str
+        _stop = start + old_len
+        _offset = len(new_text) - old_len
+        _lines = new_text.count('\n') - _buffer.count('\n', start, _stop)
+        _data.buffer = ''.join((_buffer[:start], new_text, _buffer[_stop:],))
+        _data.examined = 0
+        _memo = self.memo
+        _entries = OrderedDict()
+        _seen = set()
+        for _key, _outcome in _memo.entries.iteritems():
+            _name, _start, _args, _kwargs = _key
+            _ok, _result, _end, _examined = _outcome
+            if _examined <= start:
+                _entries[_key] = _outcome # before the edit
+            elif _start[0] >= _stop:
+                # after the edit, rules do not read behind their start
+                _start = (_start[0] + _offset,) + _start[1:]
+                if _ok:
+                    _end = (_end[0] + _offset,) + _end[1:]
+                    self.shift(_result, _offset, _lines, _seen)
+                _entries[(_name, _start, _args, _kwargs,)] = (_ok, _result, _end, _examined + _offset,)
+            else:
+                _memo.evictions += 1 # read the changed data
+        _memo.entries = _entries
+        _index = self.index
+        if _index is not None:
+            del _index.newlines[bisect_left(_index.newlines, start):]
+            _index.scanned = min(_index.scanned, start)
+        self.state.restore(self.State(_data, self.cut).snapshot())
+        self.furthest = self.cut
+        del self.expected[:]
+
+    def shift(self, result, offset, lines, seen):
+        r""" Moves the positions in ``result'' by ``offset'' characters and ``lines'' lines, see ``edit''.
+
+        Called for each reused result that follows an edit.
+        ``seen'' is the set of ids of the results already moved,
+        an override must check and update it because nested results are reused on their own too.
+        Results without positions need nothing, the default does nothing.
+        """
+        pass
+
+    def limit(self, budget, names=None):
+        r""" Stops the parser with ``BudgetExceeded'' when ``budget'' is exhausted.
+
+        ``names'' selects the rule methods that count as steps, defaults to ``rule_names()''.
+        Only this instance is affected, rule methods are wrapped on the instance.
+        The clock of the budget starts now.
+        """
+        if not isinstance(budget, Budget):
+            raise ValueError, type(budget) # expecting Budget
+        if self.budget is not None:
+            raise RuntimeError, self.budget # already limited
+        if names is None:
+            names = self.rule_names()
+        self.budget = budget
+        for _name in names:
+            setattr(self, _name, _BudgetRule(self, _name, getattr(self, _name)))
+        budget.start()
+        return budget
+
+    def profile(self, profiler=None, names=None):
+        r""" Records per-rule statistics, see ``Profile'' and ``RuleStats''.
+
+        ``profiler'' is the ``Profile'' to use, defaults to a new one.
+        ``names'' selects the rule methods, defaults to ``rule_names()''.
+        Only this instance is affected, rule methods and ``restore'' are wrapped on the instance,
+        parsers that are not profiled have no overhead.
+        """
+        if profiler is None:
+            profiler = Profile()
+        if not isinstance(profiler, Profile):
+            raise ValueError, type(profiler) # expecting Profile
+        if self.profiler is not None:
+            raise RuntimeError, self.profiler # already profiled
+        if names is None:
+            names = self.rule_names()
+        self.profiler = profiler
+        for _name in names:
+            setattr(self, _name, _ProfileRule(self, _name, getattr(self, _name)))
+        self.restore = _ProfileRestore(self, self.restore)
+        return profiler
+
+    def heatmap(self, heatmapper=None):
+        r""" Records which input offsets are parsed again after a restore, see ``Heatmap''.
+
+        ``heatmapper'' is the ``Heatmap'' to use, defaults to a new one.
+        Only this instance is affected, ``restore'' is wrapped on the instance.
+        """
+        if heatmapper is None:
+            heatmapper = Heatmap()
+        if not isinstance(heatmapper, Heatmap):
+            raise ValueError, type(heatmapper) # expecting Heatmap
+        if self.heatmapper is not None:
+            raise RuntimeError, self.heatmapper # already recording
+        self.heatmapper = heatmapper
+        self.restore = _HeatmapRestore(self, self.restore)
+        return heatmapper
 
     def maybe(self, func, *args, **kwargs):
         r""" Call ``func'' with the provided arguments.
 
-        Return ``None'' on ´´AssertionError''.
+        Return ``None'' on ´´AssertionError'' or ``FAIL''.
+        The name of ``func'' is expected (see ``fail'') unless it is private (``_'' prefix).
         """
         if not isinstance(self, ParserSkeleton):
             raise RuntimeError, type(self) # expecting ParserSkeleton
         if not getattr(self, func.__name__) == func:
             raise ValueError, repr(func) # must belong to self
 
+        self.stack.append(self.checkpoint())
         try:
-            with self: # revert state on error
-                return func(*args, **kwargs)
+            _result = func(*args, **kwargs)
         except AssertionError:
+            _result = FAIL
+        except:
+            _snapshot = self.stack.pop(-1)
+            if _snapshot is not None:
+                self.restore(_snapshot)
+            raise
+        _snapshot = self.stack.pop(-1)
+        if _result is FAIL:
+            self.restore(_snapshot)
+            if not func.__name__.startswith('_'):
+                self.fail(func.__name__)
             return None
+        return _result
 # ssalc ParserSkeleton
 
 
+class ParserPool(object):
+    r""" Thread-safe pool of parsers that are reused with ``ParserSkeleton.reset''.
+
+    ``acquire'' returns a parser of a class ready for the data, a new one if none is idle,
+    and ``release'' gives it back.
+    At most ``size'' idle parsers are kept per class.
+    Parsers that were configured (see ``configured'') are not kept,
+    ``reset'' keeps the configuration and the next caller expects a plain parser.
+    ``created'' and ``reused'' count the parsers that were handed out.
+    """
+
+    def __init__(self, size=8):
+        if not (isinstance(size, int) and size >= 0):
+            raise ValueError, size # expecting int >= 0
+        object.__init__(self)
+        self.size = size
+        self.lock = Lock()
+        self.idle = {} # parser class -> [parser, ...]
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, parser_class, data='', offset=0):
+        r""" Returns a parser of ``parser_class'' for ``data'', see ``ParserSkeleton.reset''. """
+        if not (isinstance(parser_class, type) and issubclass(parser_class, ParserSkeleton)):
+            raise ValueError, parser_class # expecting a ParserSkeleton class
+        with self.lock:
+            _idle = self.idle.get(parser_class)
+            if _idle:
+                _parser = _idle.pop()
+                self.reused += 1
+            else:
+                _parser = None
+                self.created += 1
+        if _parser is None:
+            return parser_class(data, offset)
+        _parser.reset(data, offset)
+        return _parser
+
+    def configured(self, parser):
+        r""" Returns True if ``parser'' has a handler, memo, budget, profiler, heatmap, spans or no cuts. """
+        return (parser.handler is not None or parser.memo is not None or parser.budget is not None or
+                parser.profiler is not None or parser.heatmapper is not None or parser.spans or not parser.cuts)
+
+    def release(self, parser):
+        r""" Gives back a parser from ``acquire'', it must not be used afterwards. """
+        if not isinstance(parser, ParserSkeleton):
+            raise ValueError, type(parser) # expecting ParserSkeleton
+        if self.configured(parser):
+            return # dropped
+        with self.lock:
+            _idle = self.idle.setdefault(type(parser), [])
+            if len(_idle) < self.size:
+                _idle.append(parser)
+
+    def parse(self, parser_class, name, data):
+        r""" Returns the result of the rule ``name'' for ``data'' with a pooled parser, see ``ParserSkeleton.parse''. """
+        _parser = self.acquire(parser_class, data)
+        try:
+            return _parser.parse(name)
+        finally:
+            self.release(_parser)
+# ssalc ParserPool
+
+
+def test():
+    println('GO pyparse.parser')
+    StringIO = import_module('StringIO').StringIO
+    TemporaryFile = import_module('tempfile').TemporaryFile
+    Thread = import_module('threading').Thread
+
+    name = 'ParserSkeleton offset'
+    try:
+        s = 'abcdef'
+        p = ParserSkeleton(s)
+        assert p[0] == 'a', p.state
+        assert p.consume(2) == 'ab', p.state
+        assert p.state.offset == 2, p.state
+        assert p.state.data is s, p.state # never copied
+        assert p[0] == 'c', p.state
+        assert p[0:2] == 'cd', p.state
+        assert p.starts_with('cde'), p.state
+        assert not p.starts_with('ab'), p.state
+        assert p.consume(10) == 'cdef', p.state
+        assert p.state.offset == 6, p.state
+        assert p[0] is None, p.state
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton span'
+    try:
+        p = ParserSkeleton('  \t-x-y z')
+        _whitespace = CharClass(' \t')
+        _letters = CharClass(ranges=(('a', 'z',),))
+        assert 'x' in _letters and '-' not in _letters, _letters
+        assert p.span(_whitespace) == 3, p.state
+        assert p.span(_letters) == 0, p.state
+        assert p.span_until(_letters) == 4, p.state
+        assert p.find('y') == 6, p.state
+        assert p.find('?') == -1, p.state
+        assert p.span(_letters, 4) == 1, p.state
+        assert p.span_until(_letters, 5) == 1, p.state
+        assert p.find('-', 4) == 1, p.state
+        p.consume(8)
+        assert p.span(_letters) == 1, p.state
+        assert p.span_until(_whitespace) == 1, p.state
+        assert p.span_until(CharClass()) == 1, p.state
+        p.consume(1)
+        assert p.span(_letters) == 0, p.state # end of data
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton choice'
+    try:
+        class _Parser(ParserSkeleton):
+            CHOICE = Choice(
+                ('a', 'rule_AB',),
+                (CharClass('ab'), 'rule_A',),
+                (None, 'rule_Other',),
+            )
+            calls = ()
+            def rule_AB(self):
+                self.calls += ('AB',)
+                if not self.starts_with('ab'):
+                    return FAIL
+                return self.consume(2)
+            def rule_A(self):
+                self.calls += ('A',)
+                return self.consume(1)
+            def rule_Other(self):
+                self.calls += ('Other',)
+                return 'other'
+        p = _Parser('aab')
+        assert p.choice(p.CHOICE) == 'a', p.state # ordered
+        assert p.calls == ('AB', 'A',), p.calls
+        p.calls = ()
+        assert p.choice(p.CHOICE) == 'ab', p.state
+        assert p.calls == ('AB',), p.calls
+        p.calls = ()
+        assert p.choice(p.CHOICE) == 'other', p.state # end of data
+        assert p.calls == ('Other',), p.calls
+        assert p.CHOICE.candidates('b') == ('rule_A', 'rule_Other',), p.CHOICE.table
+        assert p.CHOICE.candidates('c') == ('rule_Other',), p.CHOICE.table
+        class _Parser(ParserSkeleton):
+            CHOICE = Choice(('a', '_ab',), ('a', '_ac',), name='rule_A')
+            def _ab(self):
+                return FAIL
+            def _ac(self):
+                return FAIL
+        p = _Parser('ax')
+        assert p.choice(p.CHOICE) is FAIL, p.state
+        assert p.expected == ['rule_A'], p.expected # private alternatives are not reported
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton stream'
+    try:
+        p = ParserSkeleton(StringIO('  abc  def\nghi'))
+        p.state.data.chunk_size = 2
+        assert p[0] == ' ', p.state
+        assert len(p.state.data.buffer) == 2, p.state.data.buffer # read on demand
+        assert p.span(CharClass(' ')) == 2, p.state
+        assert p.consume(2) == '  ', p.state
+        assert p.starts_with('abc'), p.state
+        assert p.span_until(CharClass(' ')) == 3, p.state
+        assert p.find('\n') == 8, p.state
+        assert p.find('?') == -1, p.state
+        assert p.state.data.eof, p.state.data
+        p.consume(5)
+        p.commit()
+        assert p.state.data.base == 7, p.state.data.base # released
+        assert p[0:3] == 'def', p.state
+        assert p.consume(10) == 'def\nghi', p.state
+        assert p[0] is None, p.state
+        try:
+            p.state.data[0]
+            assert False, p.state.data # expecting IndexError
+        except IndexError:
+            pass
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton source'
+    try:
+        s = 'abc def'
+        p = ParserSkeleton(s)
+        p.consume(3)
+        _view = p.source(0)
+        assert isinstance(_view, StrView) and _view.obj is s, _view # nothing copied
+        assert (_view.start, _view.stop,) == (0, 3,), _view
+        assert str(_view) == 'abc', _view
+        assert str(p.source(4, 7)) == 'def', p.state
+        p = ParserSkeleton(StringIO(s))
+        p.consume(3)
+        assert p.source(0) == 'abc', p.state # streamed input is copied
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton lines'
+    try:
+        s = 'ab\ncd\n\nef'
+        p = ParserSkeleton(s)
+        assert p.line() == 1, p.state
+        assert p.position(0) == (1, 1,), p.index.newlines
+        assert p.position(2) == (1, 3,), p.index.newlines # the newline is the end of the line
+        assert p.position(3) == (2, 1,), p.index.newlines
+        assert p.index.scanned == 3, p.index.scanned # lazy
+        assert p.position(7) == (4, 1,), p.index.newlines
+        assert p.line(len(s)) == 4, p.index.newlines
+        assert list(p.index.newlines) == [2, 5, 6], p.index.newlines
+        p = ParserSkeleton(StringIO(s))
+        p.state.data.chunk_size = 2
+        p.consume(7)
+        p.commit()
+        assert p.state.data.base == 7, p.state.data.base # released
+        assert p.index.scanned == 7, p.index.scanned # indexed before release
+        assert p.position(8) == (4, 2,), p.index.newlines
+        p = ParserSkeleton(FeedBuffer('ab\ncd'))
+        assert p.position(5) == (2, 3,), p.index.newlines
+        assert not p.state.data.starved, p.state.data # only the fed data is read
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton mmap'
+    try:
+        f = TemporaryFile()
+        f.write('  abc  def')
+        f.flush()
+        m = mmap(f.fileno(), 0, access=ACCESS_READ)
+        p = ParserSkeleton(m)
+        assert p.state.data is m, p.state # used in place
+        assert p.span(CharClass(' ')) == 2, p.state
+        assert p.consume(2) == '  ', p.state
+        assert p.starts_with('abc'), p.state
+        assert not p.starts_with('abd'), p.state
+        assert p.find('d') == 5, p.state
+        assert p.consume(10) == 'abc  def', p.state
+        assert p[0] is None, p.state
+        m.close()
+        f.close()
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton views'
+    try:
+        for _data in (u'  abc  def', bytearray('  abc  def'), memoryview('  abc  def'), StrView('x  abc  defx', 1, 11),):
+            p = ParserSkeleton(_data)
+            assert p.span(CharClass(' ')) == 2, p.state
+            assert p.consume(2) == '  ', p.state
+            assert p.starts_with('abc'), p.state
+            assert not p.starts_with('abd'), p.state
+            assert p.find('d') == 5, p.state
+            assert p[0] == 'a' and p[1:3] == 'bc', p.state
+            assert p.span_until(CharClass(' ')) == 3, p.state
+            _text = p.consume(10)
+            assert _text == 'abc  def', p.state
+            if not isinstance(_data, basestring):
+                assert isinstance(_text, StrView), _text # not copied
+            assert p[0] is None, p.state
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton snapshot'
+    try:
+        class _State(ParserSkeleton.State):
+            _fields = ParserSkeleton.State._fields + ('n',)
+            def __init__(self, *args, **kwargs):
+                ParserSkeleton.State.__init__(self, *args, **kwargs)
+                self.n = 0
+        class _Parser(ParserSkeleton):
+            State = _State
+            def rule_A(self):
+                with self:
+                    self.state.n += 1
+                    _a = self.consume(1)
+                    assert _a == 'a', _a
+                return _a
+        p = _Parser('ab')
+        _state = p.state
+        assert p.checkpoint() == (0, 0, 0,), p.checkpoint()
+        assert p.maybe(p.rule_A) == 'a', p.state
+        assert p.checkpoint() == (1, 0, 1,), p.checkpoint()
+        assert p.maybe(p.rule_A) is None, p.state
+        assert p.checkpoint() == (1, 0, 1,), p.checkpoint() # reverted
+        assert p.state is _state, p.state # never replaced
+        assert len(p.stack) == 0, p.stack
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton FAIL'
+    try:
+        class _Parser(ParserSkeleton):
+            def rule_A(self):
+                _a = self.consume(1)
+                if _a != 'a':
+                    return FAIL
+                return _a
+        p = _Parser('ab')
+        assert p.maybe(p.rule_A) == 'a', p.state
+        assert p.rule_A() is FAIL, p.state
+        p.restore((1,))
+        assert p.maybe(p.rule_A) is None, p.state
+        assert p.state.offset == 1, p.state # reverted
+        assert len(p.stack) == 0, p.stack
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton validate'
+    try:
+        class _Parser(ParserSkeleton):
+            def rule_AB(self):
+                if not self.starts_with('ab'):
+                    return FAIL
+                _ab = self.consume(2)
+                if self.building():
+                    return ('AB', _ab,)
+                return True
+        p = _Parser('ababab')
+        assert p.validate('rule_AB') == (True, 6,), p.state
+        assert p.validating is False, p.validating
+        p = _Parser('ababa')
+        assert p.validate('rule_AB') == (False, 4,), p.state
+        assert p.maybe(p.rule_AB) is None, p.state
+        p = _Parser('ab')
+        assert p.maybe(p.rule_AB) == ('AB', 'ab',), p.state
+        p = _Parser('')
+        assert p.validate('rule_AB') == (True, 0,), p.state
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton error'
+    try:
+        class _Parser(ParserSkeleton):
+            def rule_Pair(self):
+                _snapshot = self.checkpoint()
+                _key = self.token_WORD()
+                if _key is FAIL or self.consume(1) != '=':
+                    self.restore(_snapshot)
+                    return self.fail('rule_Pair')
+                _value = self.choice(self.VALUE)
+                if _value is FAIL:
+                    self.restore(_snapshot)
+                    return FAIL
+                return (_key, _value,)
+            def token_WORD(self):
+                _n = self.span(CharClass(ranges=(('a', 'z',),)))
+                if _n == 0:
+                    return self.fail('token_WORD')
+                return self.consume(_n)
+            def token_NUMBER(self):
+                _n = self.span(CharClass(ranges=(('0', '9',),)))
+                if _n == 0:
+                    return self.fail('token_NUMBER')
+                return self.consume(_n)
+            VALUE = Choice((None, 'token_WORD',), (None, 'token_NUMBER',))
+        p = _Parser('abc=12')
+        assert p.parse('rule_Pair') == ('abc', '12',), p.state
+        p = _Parser('x=\n!')
+        try:
+            p.parse('rule_Pair')
+            assert False, p.state # expecting ParseError
+        except ParseError as _err:
+            assert (_err.offset, _err.line, _err.column,) == (2, 1, 3,), _err
+            assert _err.expected == ('token_WORD', 'token_NUMBER',), _err # interned names, no state
+            assert p.state.offset == 0, p.state # reverted
+        p = _Parser('x=1\n!')
+        try:
+            p.parse('rule_Pair')
+            assert False, p.state # expecting ParseError
+        except ParseError as _err:
+            assert (_err.offset, _err.line, _err.column, _err.expected,) == (3, 1, 4, ('end of data',),), _err
+        assert repr(p.state) == 'ParserSkeleton.State(<str>, 3)', repr(p.state) # no data
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton limit'
+    try:
+        class _Parser(ParserSkeleton):
+            def rule_A(self):
+                # A = 'a' A 'b' | 'a' A 'c' | 'a' ;; exponential without memoization
+                _snapshot = self.checkpoint()
+                for _c in 'bc':
+                    if self.consume(1) == 'a' and self.rule_A() is not FAIL and self.consume(1) == _c:
+                        return True
+                    self.restore(_snapshot)
+                if self.consume(1) != 'a':
+                    self.restore(_snapshot)
+                    return FAIL
+                return True
+        p = _Parser('a' * 30)
+        budget = p.limit(Budget(steps=1000))
+        try:
+            p.rule_A()
+            assert False, budget.steps # expecting BudgetExceeded
+        except BudgetExceeded as _err:
+            assert _err.reason == 'steps' and budget.steps == 1001, (_err, budget.steps,)
+            assert _err.offset == budget.furthest > 0, _err
+        p = _Parser('a' * 30)
+        budget = p.limit(Budget(backtracks=10))
+        try:
+            p.maybe(p.rule_A)
+            assert False, budget.backtracks # expecting BudgetExceeded
+        except BudgetExceeded as _err:
+            assert _err.reason == 'backtracks', _err
+            assert p.state.offset == 0 and len(p.stack) == 0, p.state # reverted by maybe
+        _now = [0]
+        def _clock():
+            _now[0] += 1
+            return _now[0]
+        p = _Parser('a' * 30)
+        budget = p.limit(Budget(seconds=3, clock=_clock))
+        try:
+            p.rule_A()
+            assert False, budget.steps # expecting BudgetExceeded
+        except BudgetExceeded as _err:
+            assert _err.reason == 'time' and budget.steps == Budget.CLOCK_STEPS * 4, (_err, budget.steps,) # clock 1 + 3 < 5
+        p = _Parser('aab')
+        budget = p.limit(Budget(steps=1000, backtracks=1000, seconds=60))
+        assert p.maybe(p.rule_A) is True and p.state.offset == 3, p.state
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton profile'
+    try:
+        _now = [0]
+        def _clock():
+            _now[0] += 1
+            return _now[0]
+        class _Parser(ParserSkeleton):
+            def rule_AB(self):
+                with self:
+                    _a = self.token_A()
+                    _b = self.token_B()
+                return _a + _b
+            def token_A(self):
+                if self[0] != 'a':
+                    return FAIL
+                return self.consume(1)
+            def token_B(self):
+                _b = self.consume(1)
+                assert _b == 'b', _b
+                return _b
+        p = _Parser('abac')
+        profiler = p.profile(Profile(clock=_clock))
+        assert p.maybe(p.rule_AB) == 'ab', p.state
+        assert p.maybe(p.rule_AB) is None, p.state
+        ab = profiler.rules['rule_AB']
+        a = profiler.rules['token_A']
+        b = profiler.rules['token_B']
+        assert (ab.calls, ab.ok, ab.failed, ab.consumed, ab.restores,) == (2, 1, 1, 2, 1,), ab
+        assert (a.calls, a.ok, a.failed, a.consumed, a.restores,) == (2, 2, 0, 2, 0,), a
+        assert (b.calls, b.ok, b.failed, b.consumed, b.restores,) == (2, 1, 1, 1, 0,), b
+        assert (a.inclusive, a.exclusive,) == (2, 2,), a # one tick per call
+        assert (ab.inclusive, ab.exclusive,) == (10, 6,), ab # 5 ticks per call, 2 of them in the tokens
+        assert sorted(profiler.rules) == ['rule_AB', 'token_A', 'token_B'], profiler.rules
+        assert profiler.sorted('exclusive')[0] is ab, profiler.rules
+        _report = profiler.report('inclusive', limit=2).split('\n')
+        assert len(_report) == 3 and _report[1].startswith('rule_AB '), _report
+        assert 'restore' not in _Parser('').__dict__, _Parser('').__dict__ # not profiled
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton heatmap'
+    try:
+        class _Parser(ParserSkeleton):
+            def rule_Line(self):
+                # Line = 'ab' 'c' '\n' | 'a' 'bd' '\n' | 'abe\n'
+                for _parts in (('ab', 'c\n',), ('a', 'bd\n',), ('abe\n',),):
+                    try:
+                        with self:
+                            for _part in _parts:
+                                assert self.consume(len(_part)) == _part, _part
+                        return True
+                    except AssertionError:
+                        pass
+                return FAIL
+        s = 'abc\nabd\nabe\n'
+        p = _Parser(s)
+        heatmap = p.heatmap()
+        while p.maybe(p.rule_Line):
+            pass
+        assert p.state.offset == len(s), p.state
+        assert list(heatmap.counts()) == [0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2], heatmap.counts()
+        assert list(heatmap.lines(s)) == [0, 4, 8], heatmap.lines(s)
+        f = StringIO()
+        heatmap.dump(f)
+        f.seek(0)
+        assert Heatmap.load(f) == heatmap.counts(), f.getvalue()
+        _report = heatmap.report(s).split('\n')
+        assert _report[0] == '3 restores, 2 lines visited again', _report
+        assert _report[1].split()[:3] == ['line', '3', '8'], _report
+        assert heatmap.report(limit=1).split('\n')[1].split()[:3] == ['offset', '11', '2'], heatmap.report()
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton memoize'
+    try:
+        class _Parser(ParserSkeleton):
+            calls = 0
+            def rule_A(self):
+                self.calls += 1
+                _a = self.consume(1)
+                assert _a == 'a', _a
+                return _a
+            def rule_AB(self):
+                with self:
+                    _a = self.rule_A()
+                    _b = self.consume(1)
+                    assert _b == 'b', _b
+                return _a + _b
+            def rule_AorAB(self):
+                _ab = self.maybe(self.rule_AB)
+                if _ab is not None:
+                    return _ab
+                return self.rule_A()
+        p = _Parser('acab')
+        memo = p.memoize()
+        assert p.rule_AorAB() == 'a', p.state
+        assert p.calls == 1, p.calls # rule_A reused after rule_AB failed
+        assert memo.hits == 1, memo.hits
+        assert p.consume(1) == 'c', p.state
+        assert p.rule_AorAB() == 'ab', p.state
+        assert p.state.offset == 4, p.state
+        p.restore((2,))
+        assert p.rule_AorAB() == 'ab', p.state # from the memo
+        assert p.calls == 2, p.calls
+        assert p.state.offset == 4, p.state
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton reset'
+    try:
+        class _Parser(ParserSkeleton):
+            def rule_AB(self):
+                _n = self.span(CharClass('ab'))
+                if _n == 0:
+                    return self.fail('rule_AB')
+                return self.consume(_n)
+        p = _Parser('ab!')
+        memo = p.memoize()
+        budget = p.limit(Budget(steps=3))
+        profiler = p.profile()
+        _state = p.state
+        _stack = p.stack
+        assert p.maybe(p.rule_AB) == 'ab' and p.maybe(p.rule_AB) is None, p.state
+        p.reset('ba')
+        assert p.state is _state and p.stack is _stack, p.state # reused
+        assert (p.state.offset, p.furthest, p.expected, len(memo),) == (0, 0, [], 0,), (p.state, p.furthest, p.expected, memo.entries,)
+        assert p.memo is memo and budget.steps == 0, budget.steps
+        assert p.parse('rule_AB') == 'ba', p.state
+        assert profiler.rules['rule_AB'].calls == 3, profiler.rules # keeps counting
+        p.reset(StringIO('aaa'), 1)
+        assert p.parse('rule_AB') == 'aa', p.state
+        p = _Parser('ab')
+        p.incremental()
+        p.reset('ba')
+        assert isinstance(p.state.data, EditBuffer) and p.parse('rule_AB') == 'ba', p.state
+        pool = ParserPool(size=1)
+        _threads = [Thread(target=pool.parse, args=(_Parser, 'rule_AB', 'ab' * _i,)) for _i in xrange(1, 9)]
+        for _thread in _threads:
+            _thread.start()
+        for _thread in _threads:
+            _thread.join()
+        assert pool.created + pool.reused == 8 and len(pool.idle[_Parser]) == 1, (pool.created, pool.reused, pool.idle,)
+        p = pool.acquire(_Parser, 'bb')
+        assert pool.idle[_Parser] == [] and p.parse('rule_AB') == 'bb', p.state
+        pool.release(p)
+        assert pool.acquire(_Parser, 'a') is p and p.state.data == 'a', p.state
+        try:
+            pool.parse(_Parser, 'rule_AB', '!')
+            assert False, pool # expecting ParseError
+        except ParseError:
+            pass
+        assert len(pool.idle[_Parser]) == 1, pool.idle # released on errors
+        p = pool.acquire(_Parser, 'ab')
+        p.listen(Handler())
+        pool.release(p)
+        assert pool.idle[_Parser] == [] and pool.parse(_Parser, 'rule_AB', 'ab') == 'ab', pool.idle # not reused
+        p = pool.acquire(_Parser, 'ab')
+        assert p.handler is None, p.handler
+        p.limit(Budget(steps=1))
+        pool.release(p)
+        assert pool.parse(_Parser, 'rule_AB', 'abab') == 'abab', pool.idle # not limited
+        assert pool.acquire(_Parser, 'a').budget is None, pool.idle
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParserSkeleton commit'
+    try:
+        class _Parser(ParserSkeleton):
+            def rule_A(self):
+                _a = self.consume(1)
+                if _a != 'a':
+                    return FAIL
+                self.commit()
+                return _a
+            def rule_AB(self):
+                with self:
+                    _a = self.rule_A()
+                    _b = self.consume(1)
+                    assert _b == 'b', _b
+                return _a + _b
+        p = _Parser('aaab')
+        memo = p.memoize(Memo(window=10))
+        assert p.maybe(p.rule_A) == 'a', p.state
+        assert p.cut == 1, p.cut
+        assert len(memo) == 0, memo.entries # memo entry started before the cut
+        try:
+            p.maybe(p.rule_AB)
+            assert False, p.state # expecting CutError
+        except CutError:
+            pass
+        assert len(p.stack) == 0, p.stack
+        assert p.state.offset == 3, p.state # not reverted
+        assert p.maybe(p.rule_AB) is None, p.state # nothing committed
+        assert p.state.offset == 3, p.state
+
+        p = _Parser('aa')
+        p.cuts = False
+        assert p.rule_A() == 'a', p.state
+        assert p.cut == 0, p.cut # ignored
+        p.restore((0,))
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'Memo eviction'
+    try:
+        memo = Memo(size=2)
+        memo.put(('a', (0,), (), (),), 0, 'A')
+        memo.put(('b', (1,), (), (),), 1, 'B')
+        assert memo.get(('a', (0,), (), (),)) == 'A', memo.entries
+        memo.put(('c', (2,), (), (),), 2, 'C')
+        assert len(memo) == 2, memo.entries
+        assert memo.get(('b', (1,), (), (),)) is None, memo.entries # least recently used
+        assert memo.evictions == 1, memo.evictions
+        memo = Memo(window=2)
+        for _i in xrange(10):
+            memo.put(('a', (_i,), (), (),), _i, _i)
+        assert len(memo) == 3, memo.entries # 7, 8 and 9
+        assert memo.get(('a', (6,), (), (),)) is None, memo.entries
+        assert memo.get(('a', (7,), (), (),)) == 7, memo.entries
+        assert (memo.hits, memo.misses, memo.evictions,) == (1, 1, 7,), memo
+        memo.clear()
+        assert len(memo) == 0 and memo.low == 0, memo.entries
+        assert (memo.hits, memo.misses, memo.evictions,) == (1, 1, 7,), memo # counters keep counting
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    println('OG pyparse.parser')
+# fed test
+
+
 __all__ = []
 __builtins__ = {} # enter restricted mode
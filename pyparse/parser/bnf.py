@@ -21,6 +21,13 @@ from __builtin__ import repr
 from __builtin__ import str
 from __builtin__ import tuple
 from __builtin__ import type
+from pyparse.parser import Budget
+from pyparse.parser import BudgetExceeded
+from pyparse.parser import CharClass
+from pyparse.parser import Choice
+from pyparse.parser import FAIL
+from pyparse.parser import ParseError
+from pyparse.parser import Handler
 from pyparse.parser import ParserSkeleton
 from pyparse.parser.unicode import Utf8Parser
 from pyparse.util import IndexToAttrMixin
@@ -48,8 +55,30 @@ class McKeemanFormParser(ParserSkeleton):
     @see https://www.crockford.com/mckeeman.html
     """
 
+    HEX = CharClass('0123456789ABCDEF')
+    LETTER = CharClass('_', (('a', 'z',), ('A', 'Z',),))
+
+    ITEM = Choice(
+        ('\'"', 'rule_Literal',),
+        (LETTER, 'token_NAME',),
+        name='rule_Item',
+    )
+    LITERAL = Choice(
+        # NOTE range must come first because it starts with a singleton
+        ("'", '_literal_range',),
+        ("'", 'rule_Singleton',),
+        ('"', '_literal_characters',),
+        name='rule_Literal',
+    )
+    CODEPOINT = Choice(
+        # NOTE hexcode must come first because it is longer
+        (HEX, '_codepoint_hexcode',),
+        (CharClass(ranges=((' ', '\xFF',),)), '_codepoint_str',),
+        name='rule_Codepoint',
+    )
+
     def _str(self, s):
-        assert self.starts_with(s), (s, self.state,) # expecting s
+        assert self.starts_with(s), self.expecting(s) # expecting s
         return self.consume(len(s))
 
     def _codepoint(self, low, high=None):
@@ -57,18 +86,28 @@ class McKeemanFormParser(ParserSkeleton):
             high = low
         if not low <= high:
             raise ValueError, (low, high,) # expecting low <= high
-        _p = Utf8Parser(self.state.data)
+        _p = Utf8Parser(self.state.data, self.state.offset)
         _codepoint = _p.rule_Codepoint()
         _codepoint = _codepoint.codepoint
-        _n = len(self.state.data) - len(_p.state.data)
+        _n = _p.state.offset - self.state.offset
         return (_codepoint, self.consume(_n),)
 
     def rule_Grammar(self):
         r"""
         grammar
             rules
+
+        In event mode (see ``listen'') the grammar is reported as 'Grammar', 'Rule' and 'Alternative'
+        start/end events with 'name', 'nothing' and 'Item' events, and ``.rules'' is empty.
+        In validation mode (see ``validate'') ``.rules'' is empty.
         """
+        _events = self.handler is not None
+        if _events:
+            self.start('Grammar')
         _rules = self.rule_Rules()
+        if _events:
+            self.end('Grammar')
+            self.commit() # grammar accepted
         return (
             'Grammar',
             '.rules', _rules,
@@ -115,14 +154,14 @@ class McKeemanFormParser(ParserSkeleton):
             '_'
         """
         _c = self[0]
-        assert _c is not None, (self.state,) # expecting a letter
+        assert _c is not None, self.expecting('token_LETTER') # expecting a letter
         if _c >= 'a' and _c <= 'z':
             return self.consume(len(_c))
         if _c >= 'A' and _c <= 'Z':
             return self.consume(len(_c))
         if _c == '_':
             return self.consume(len(_c))
-        assert False, (_c,self.state,) # expecting a letter
+        assert False, self.expecting('token_LETTER') # expecting a letter
 
     def token_INDENTATION(self):
         r"""
@@ -141,14 +180,25 @@ class McKeemanFormParser(ParserSkeleton):
         rules
             rule
             rule newline rules
+
+        In event mode (see ``listen'') each accepted rule is a cut point (see ``commit'').
         """
+        _build = self.building()
+        _events = self.handler is not None
         _rules = [self.rule_Rule()] # one or more
+        if not _build:
+            _rules = []
+        if _events:
+            self.commit() # rule accepted
         while True:
             try:
                 with self: # restore state on error
                     _discard = self.token_NEWLINE()
                     _rule = self.rule_Rule()
-                _rules += [_rule]
+                if _build:
+                    _rules += [_rule]
+                if _events:
+                    self.commit() # rule accepted
                 continue
             except AssertionError:
                 pass
@@ -169,7 +219,13 @@ class McKeemanFormParser(ParserSkeleton):
             _name = self.token_NAME()
             _newline = self.token_NEWLINE()
             _nothing = self.rule_Nothing()
+            if self.handler is not None:
+                self.start('Rule')
+                self.token('name', _name)
+                self.token('nothing', _nothing)
             _alternatives = self.rule_Alternatives()
+            if self.handler is not None:
+                self.end('Rule')
         return (
             'Rule',
             '.name', _name,
@@ -200,12 +256,16 @@ class McKeemanFormParser(ParserSkeleton):
             alternative
             alternative alternatives
         """
+        _build = self.building()
         _alternatives = [self.rule_Alternative()] # one or more
+        if not _build:
+            _alternatives = []
         while True:
             _alternative = self.maybe(self.rule_Alternative)
             if _alternative is None:
                 break
-            _alternatives += [_alternative]
+            if _build:
+                _alternatives += [_alternative]
         return tuple(_alternatives)
 
     def rule_Alternative(self):
@@ -215,8 +275,12 @@ class McKeemanFormParser(ParserSkeleton):
         """
         with self: # restore state on error
             _discard = self.token_INDENTATION()
+            if self.handler is not None:
+                self.start('Alternative')
             _items = self.rule_Items()
             _discard = self.token_NEWLINE()
+            if self.handler is not None:
+                self.end('Alternative')
         return _items
 
     def rule_Items(self):
@@ -225,7 +289,13 @@ class McKeemanFormParser(ParserSkeleton):
             item
             item space items
         """
+        _events = self.handler is not None
+        _build = self.building()
         _items = [self.rule_Item()] # one or more
+        if _events:
+            self.token('Item', _items[0])
+        if not _build:
+            _items = []
         while True:
             with self: # restore state on error
                 _space = self.maybe(self.token_SPACE)
@@ -234,7 +304,10 @@ class McKeemanFormParser(ParserSkeleton):
                 _item = self.maybe(self.rule_Item)
                 if _item is None:
                     break
-            _items += [_item]
+            if _events:
+                self.token('Item', _item)
+            elif _build:
+                _items += [_item]
         return tuple(_items)
 
     def rule_Item(self):
@@ -243,13 +316,9 @@ class McKeemanFormParser(ParserSkeleton):
             literal
             name
         """
-        _literal = self.maybe(self.rule_Literal)
-        if _literal is not None:
-            return _literal
-        _name = self.maybe(self.token_NAME)
-        if _name is not None:
-            return _name
-        assert False, (self.state,) # not a rule_Item?
+        _item = self.choice(self.ITEM)
+        assert _item is not FAIL, self.expecting('rule_Item') # not a rule_Item?
+        return _item
 
     def rule_Literal(self):
         r"""
@@ -258,31 +327,25 @@ class McKeemanFormParser(ParserSkeleton):
             range exclude
             '"' characters '"'
         """
-        # NOTE range must come first because it starts with a singleton
-        try:
-            with self: # restore state on error
-                _range = self.rule_Range()
-                _exclude = self.rule_Exclude()
-            return tuple(list(_range) + ['.exclude', _exclude])
-        except AssertionError:
-            pass
-        try:
-            _singleton = self.rule_Singleton()
-            return _singleton
-        except AssertionError:
-            pass
-        try:
-            with self: # restore state on error
-                _discard = self._str('"')
-                _characters = self.token_CHARACTERS()
-                _discard = self._str('"')
-            return (
-                'Characters',
-                '.str', _characters,
-            )
-        except AssertionError:
-            pass
-        assert False, (self.state,) # not a rule_Literal?
+        _literal = self.choice(self.LITERAL)
+        assert _literal is not FAIL, self.expecting('rule_Literal') # not a rule_Literal?
+        return _literal
+
+    def _literal_range(self):
+        with self: # restore state on error
+            _range = self.rule_Range()
+            _exclude = self.rule_Exclude()
+        return tuple(list(_range) + ['.exclude', _exclude])
+
+    def _literal_characters(self):
+        with self: # restore state on error
+            _discard = self._str('"')
+            _characters = self.token_CHARACTERS()
+            _discard = self._str('"')
+        return (
+            'Characters',
+            '.str', _characters,
+        )
 
     def rule_Singleton(self):
         r"""
@@ -301,24 +364,26 @@ class McKeemanFormParser(ParserSkeleton):
             ' ' . '10FFFF'
             hexcode
         """
-        # NOTE hexcode must come first because it is longer
-        _hexcode = self.maybe(self.token_HEXCODE)
-        if _hexcode is not None:
-            _value = int(_hexcode, 16)
-            return (
-                'Codepoint',
-                '.value', _value,
-                '.hex', _hexcode,
-            )
-        _codepoint = self.maybe(self._codepoint, ord(' '), 0x10FFFF)
-        if _codepoint is not None:
-            _value, _str, = _codepoint
-            return (
-                'Codepoint',
-                '.value', _value,
-                '.str', _str,
-            )
-        assert False, (self.state,) # not a rule_Codepoint?
+        _codepoint = self.choice(self.CODEPOINT)
+        assert _codepoint is not FAIL, self.expecting('rule_Codepoint') # not a rule_Codepoint?
+        return _codepoint
+
+    def _codepoint_hexcode(self):
+        _hexcode = self.token_HEXCODE()
+        _value = int(_hexcode, 16)
+        return (
+            'Codepoint',
+            '.value', _value,
+            '.hex', _hexcode,
+        )
+
+    def _codepoint_str(self):
+        _value, _str, = self._codepoint(ord(' '), 0x10FFFF)
+        return (
+            'Codepoint',
+            '.value', _value,
+            '.str', _str,
+        )
 
     def token_HEXCODE(self):
         r"""
@@ -327,36 +392,14 @@ class McKeemanFormParser(ParserSkeleton):
             hex hex hex hex hex
             hex hex hex hex
         """
-        try:
-            with self: # restore state on error
-                _hexcode = self._str('10')
-                _hexcode += self.token_HEX()
-                _hexcode += self.token_HEX()
-                _hexcode += self.token_HEX()
-                _hexcode += self.token_HEX()
-            return _hexcode
-        except AssertionError:
-            pass
-        try:
-            with self: # restore state on error
-                _hexcode = self.token_HEX()
-                _hexcode += self.token_HEX()
-                _hexcode += self.token_HEX()
-                _hexcode += self.token_HEX()
-                _hexcode += self.token_HEX()
-            return _hexcode
-        except AssertionError:
-            pass
-        try:
-            with self: # restore state on error
-                _hexcode = self.token_HEX()
-                _hexcode += self.token_HEX()
-                _hexcode += self.token_HEX()
-                _hexcode += self.token_HEX()
-            return _hexcode
-        except AssertionError:
-            pass
-        assert False, (self.state,) # not a token_HEXCODE?
+        # NOTE the alternatives only differ in length, scan the hex digits once
+        _n = self.span(self.HEX)
+        if _n >= 6 and self.starts_with('10'):
+            return self.consume(6)
+        if _n >= 5:
+            return self.consume(5)
+        assert _n >= 4, self.expecting('token_HEXCODE') # not a token_HEXCODE?
+        return self.consume(4)
 
     def token_HEX(self):
         r"""
@@ -365,12 +408,12 @@ class McKeemanFormParser(ParserSkeleton):
             'A' . 'F'
         """
         _c = self[0]
-        assert _c is not None
+        assert _c is not None, self.expecting('token_HEX') # not a token_HEX?
         if _c >= '0' and _c <= '9':
             return self.consume(len(_c))
         if _c >= 'A' and _c <= 'F':
             return self.consume(len(_c))
-        assert False, (_c,self.state,) # not a token_HEX?
+        assert False, self.expecting('token_HEX') # not a token_HEX?
 
     def rule_Range(self):
         r"""
@@ -524,6 +567,128 @@ test
         p = McKeemanFormParser(s)
         grammar = p.rule_Grammar()
         assert grammar == syntax_tree, (grammar, syntax_tree,)
+        class _Parser(McKeemanFormParser):
+            def rule_Whole(self):
+                with self: # restore state on error
+                    _grammar = self.rule_Grammar()
+                    assert self[0] is None, self.expecting('end') # expecting the end
+                return _grammar
+        p = _Parser(s + '!!!')
+        assert p.maybe(p.rule_Whole) is None and p.state.offset == 0, p.state # no cut points
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'McKeemanFormParser memoize'
+    try:
+        p = McKeemanFormParser(s)
+        memo = p.memoize()
+        grammar = p.rule_Grammar()
+        assert grammar == syntax_tree, (grammar, syntax_tree,)
+        assert memo.hits > 0, (memo.hits, memo.misses,)
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'McKeemanFormParser edit'
+    try:
+        p = McKeemanFormParser(s)
+        memo = p.incremental()
+        grammar = p.rule_Grammar()
+        assert grammar == syntax_tree, (grammar, syntax_tree,)
+        _start = s.index("'a'") + 1
+        p.edit(_start, 1, 'b')
+        _misses = memo.misses
+        grammar = p.rule_Grammar()
+        assert grammar == McKeemanFormParser(s[:_start] + 'b' + s[_start + 1:]).rule_Grammar(), grammar
+        assert memo.misses - _misses < _misses, (memo.misses, _misses,) # most results are reused
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'McKeemanFormParser error'
+    try:
+        p = McKeemanFormParser(s.replace("    'a'\n", "    'a\n"))
+        try:
+            p.parse('rule_Grammar')
+            assert False, p.state # expecting ParseError
+        except ParseError as _err:
+            assert (_err.line, _err.column,) == (4, 7,), _err # after 'a
+            assert "'" in _err.expected, _err
+        p = McKeemanFormParser(s.replace("    'a'\n", "    '\x80'\n"))
+        try:
+            p.parse('rule_Grammar')
+            assert False, p.state # expecting ParseError
+        except ParseError as _err:
+            assert _err.expected == ('rule_Codepoint',), _err # not the private alternatives
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'McKeemanFormParser limit'
+    try:
+        p = McKeemanFormParser(s)
+        budget = p.limit(Budget(steps=50))
+        try:
+            p.rule_Grammar()
+            assert False, budget.steps # expecting BudgetExceeded
+        except BudgetExceeded as _err:
+            assert _err.reason == 'steps' and 0 < _err.offset < len(s), _err
+        p = McKeemanFormParser(s)
+        budget = p.limit(Budget(steps=10000, backtracks=1000))
+        grammar = p.rule_Grammar()
+        assert grammar == syntax_tree, (grammar, syntax_tree,)
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'McKeemanFormParser validate'
+    try:
+        p = McKeemanFormParser(s)
+        assert p.validate('rule_Grammar') == (True, len(s),), p.state
+        p = McKeemanFormParser(s + "bad\n")
+        assert p.validate('rule_Grammar') == (False, len(s) + 4,), p.state # rule without alternatives
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'McKeemanFormParser events'
+    try:
+        class _Handler(Handler):
+            def __init__(self):
+                self.events = []
+            def start(self, name):
+                self.events.append(name)
+            def end(self, name):
+                self.events.append('/' + name)
+            def token(self, name, value):
+                if name == 'name':
+                    self.events.append(value)
+                elif name == 'Item':
+                    self.events.append(value[0])
+        p = McKeemanFormParser(s)
+        handler = p.listen(_Handler())
+        grammar = p.rule_Grammar()
+        assert grammar == ('Grammar', '.rules', (),), grammar
+        assert handler.events == [
+            'Grammar',
+            'Rule', 'S',
+            'Alternative', 'Codepoint', '/Alternative',
+            'Alternative', 'Codepoint', '/Alternative',
+            'Alternative', 'S', 'Codepoint', 'S', '/Alternative',
+            '/Rule',
+            'Rule', 'test',
+            'Alternative', 'Range', '/Alternative',
+            'Alternative', 'Characters', 'Codepoint', '/Alternative',
+            '/Rule',
+            '/Grammar',
+        ], handler.events
         println('PASS', name)
     except:
         println('FAIL', name)
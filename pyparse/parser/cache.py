@@ -0,0 +1,357 @@
+# -*- coding: utf8 -*-
+# license: WTFPL version 2, or whatever is closest to "no license" and "public domain" (like Unlicense or CC0)
+r""" Module with a content-addressed cache of parse results for ``ParserSkeleton''.
+
+Module ``pyparse.parser.cache''.
+
+``ParseCache.parse(parser_class, name, data)'' returns the result of ``parser_class(data).parse(name)''
+and remembers it by (parser class, rule name, version, content hash):
+ * the memory tier is a LRU limited by the total length of the data of the entries
+ * the disk tier (optional) is a directory with one ``marshal'' file per entry
+
+The version is a hash of the source of the modules that define the parser class and its bases,
+so the entries of a parser become stale as soon as its module changes.
+``marshal'' is fast but only stores builtin types, results are converted with ``encode'' and ``decode''.
+
+Example:
+```python
+cache = ParseCache(directory='/var/cache/pyparse')
+playlist = cache.parse(M3uParser, 'rule_M3u', data)
+cache.hits, cache.disk_hits, cache.misses, cache.evictions
+```
+"""
+
+
+from __builtin__ import AttributeError
+from __builtin__ import EOFError
+from __builtin__ import False
+from __builtin__ import IOError
+from __builtin__ import IndexError
+from __builtin__ import KeyError
+from __builtin__ import OSError
+from __builtin__ import True
+from __builtin__ import TypeError
+from __builtin__ import ValueError
+from __builtin__ import basestring
+from __builtin__ import bool
+from __builtin__ import dict
+from __builtin__ import float
+from __builtin__ import getattr
+from __builtin__ import int
+from __builtin__ import isinstance
+from __builtin__ import issubclass
+from __builtin__ import len
+from __builtin__ import list
+from __builtin__ import long
+from __builtin__ import object
+from __builtin__ import repr
+from __builtin__ import set
+from __builtin__ import slice
+from __builtin__ import sorted
+from __builtin__ import str
+from __builtin__ import tuple
+from __builtin__ import type
+from collections import OrderedDict
+from hashlib import sha1
+from importlib import import_module
+from io import open as io_open
+from marshal import dumps as marshal_dumps
+from marshal import loads as marshal_loads
+from os import getpid
+from os import listdir
+from os import remove
+from os import rename
+from os.path import isdir
+from os.path import join as path_join
+from pyparse.parser import ParseError
+from pyparse.parser import ParserSkeleton
+from pyparse.util import IndexToAttrMixin
+from pyparse.util import StrView
+from pyparse.util import println
+from sys import modules
+
+
+def encode(value, parser_class):
+    r""" Returns ``value'' with builtin types that ``marshal'' can store, see ``decode''.
+
+    Nodes (``IndexToAttrMixin'' classes of ``parser_class''), lists, dicts and slices
+    are tagged with a dict, a ``StrView'' becomes a str.
+    Raises ``ValueError'' for other objects.
+    """
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return value
+    if isinstance(value, tuple):
+        return tuple([encode(_v, parser_class) for _v in value])
+    if isinstance(value, StrView):
+        return str(value)
+    if isinstance(value, list):
+        return {'list': tuple([encode(_v, parser_class) for _v in value])}
+    if isinstance(value, slice):
+        return {'slice': (value.start, value.stop, value.step,)}
+    if isinstance(value, dict):
+        return {'dict': tuple([(encode(_k, parser_class), encode(_v, parser_class),) for _k, _v in value.items()])}
+    if isinstance(value, IndexToAttrMixin):
+        _name = value.__class__.__name__
+        if getattr(parser_class, _name, None) is not value.__class__:
+            raise ValueError, _name # expecting a node class of parser_class
+        return {'node': _name, 'attrs': tuple([encode(getattr(value, _k), parser_class) for _k in value._index_to_attr])}
+    raise ValueError, type(value) # not supported
+
+
+def decode(value, parser_class):
+    r""" Returns the value that was converted by ``encode''. """
+    if isinstance(value, tuple):
+        return tuple([decode(_v, parser_class) for _v in value])
+    if isinstance(value, dict):
+        if 'node' in value:
+            _class = getattr(parser_class, value['node'])
+            return _class(*[decode(_v, parser_class) for _v in value['attrs']])
+        if 'list' in value:
+            return [decode(_v, parser_class) for _v in value['list']]
+        if 'slice' in value:
+            return slice(*value['slice'])
+        return dict([(decode(_k, parser_class), decode(_v, parser_class),) for _k, _v in value['dict']])
+    return value
+
+
+class ParseCache(object):
+    r""" Cache of parse results, keyed by (parser class, rule name, version, content hash).
+
+    ``max_bytes'' limits the memory tier, the weight of an entry is the length of its data.
+    ``directory'' enables the disk tier, it must be an existing directory.
+    Results that ``encode'' does not support only go to the memory tier.
+    A memory hit returns the same result object, a disk hit returns a new one.
+    Failures (``ParseError'') are not cached.
+
+    ``hits'', ``disk_hits'', ``misses'' and ``evictions'' count what happened to the cache.
+    """
+
+    SUFFIX = '.marshal'
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, directory=None):
+        if not (isinstance(max_bytes, int) and max_bytes > 0):
+            raise ValueError, max_bytes # expecting int > 0
+        if directory is not None and not isdir(directory):
+            raise ValueError, directory # expecting a directory
+        object.__init__(self)
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = OrderedDict() # key -> (result, weight)
+        self.bytes = 0 # total weight of the entries
+        self.versions = {} # parser class -> version
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def version(self, parser_class):
+        r""" Returns the hash of the source of the modules of ``parser_class'' and its bases. """
+        _version = self.versions.get(parser_class)
+        if _version is not None:
+            return _version
+        _hash = sha1()
+        for _name in sorted(set([_class.__module__ for _class in parser_class.__mro__])):
+            _file = getattr(modules.get(_name), '__file__', None)
+            if _file is None:
+                _hash.update(_name) # builtin module
+                continue
+            if _file.endswith(('.pyc', '.pyo',)):
+                _file = _file[:-1]
+            try:
+                _f = io_open(_file, 'rb')
+                try:
+                    _hash.update(_f.read())
+                finally:
+                    _f.close()
+            except IOError:
+                _hash.update(_file) # no source
+        _version = _hash.hexdigest()
+        self.versions[parser_class] = _version
+        return _version
+
+    def key(self, parser_class, name, data):
+        r""" Returns the key of the result of the rule ``name'' of ``parser_class'' for ``data''. """
+        if not (isinstance(parser_class, type) and issubclass(parser_class, ParserSkeleton)):
+            raise ValueError, parser_class # expecting a ParserSkeleton class
+        if not isinstance(name, str):
+            raise ValueError, name # expecting str
+        if not isinstance(data, str):
+            raise ValueError, type(data) # expecting str
+        _class = '.'.join((parser_class.__module__, parser_class.__name__,))
+        return (_class, name, self.version(parser_class), sha1(data).hexdigest(),)
+
+    def parse(self, parser_class, name, data):
+        r""" Returns the result of ``parser_class(data).parse(name)'', from the cache when possible. """
+        _key = self.key(parser_class, name, data)
+        _entry = self.entries.get(_key)
+        if _entry is not None:
+            self.hits += 1
+            # most recently used goes to the end
+            del self.entries[_key]
+            self.entries[_key] = _entry
+            return _entry[0]
+        if self.directory is not None:
+            _found, _result = self.load(_key, parser_class)
+            if _found:
+                self.disk_hits += 1
+                self.put(_key, _result, len(data))
+                return _result
+        self.misses += 1
+        _result = parser_class(data).parse(name)
+        self.put(_key, _result, len(data))
+        if self.directory is not None:
+            self.store(_key, parser_class, _result)
+        return _result
+
+    def put(self, key, result, weight):
+        r""" Stores ``result'' in the memory tier, evicting the least recently used entries. """
+        if weight > self.max_bytes:
+            return # would evict everything
+        _entries = self.entries
+        if key in _entries:
+            self.bytes -= _entries.pop(key)[1]
+        _entries[key] = (result, weight,)
+        self.bytes += weight
+        while self.bytes > self.max_bytes:
+            _, _entry = _entries.popitem(last=False)
+            self.bytes -= _entry[1]
+            self.evictions += 1
+
+    def path(self, key):
+        r""" Returns the file of ``key'' in the disk tier. """
+        return path_join(self.directory, sha1(repr(key)).hexdigest() + self.SUFFIX)
+
+    def load(self, key, parser_class):
+        r""" Returns (True, result) if the disk tier has ``key'', (False, None) otherwise. """
+        _path = self.path(key)
+        try:
+            _f = io_open(_path, 'rb')
+        except IOError:
+            return (False, None,) # not stored
+        try:
+            _s = _f.read()
+        finally:
+            _f.close()
+        try:
+            _key, _value = marshal_loads(_s)
+            if _key != key:
+                return (False, None,) # different key with the same file
+            return (True, decode(_value, parser_class),)
+        except (AttributeError, EOFError, IndexError, KeyError, TypeError, ValueError,):
+            self.evictions += 1
+            remove(_path) # damaged
+            return (False, None,)
+
+    def store(self, key, parser_class, result):
+        r""" Writes ``result'' to the disk tier, returns False if ``encode'' does not support it. """
+        try:
+            _s = marshal_dumps((key, encode(result, parser_class),))
+        except ValueError:
+            return False
+        _path = self.path(key)
+        _tmp = '.'.join((_path, str(getpid()), 'tmp',))
+        _f = io_open(_tmp, 'wb')
+        try:
+            _f.write(_s)
+        finally:
+            _f.close()
+        rename(_tmp, _path) # readers never see a partial file
+        return True
+
+    def clear(self):
+        r""" Removes all the entries, including the files of the disk tier. """
+        self.entries.clear()
+        self.bytes = 0
+        if self.directory is None:
+            return
+        for _name in listdir(self.directory):
+            if _name.endswith(self.SUFFIX):
+                try:
+                    remove(path_join(self.directory, _name))
+                except OSError:
+                    pass # removed by someone else
+# ssalc ParseCache
+
+
+def test():
+    println('GO pyparse.parser.cache')
+    EndlessSkyParser = import_module('pyparse.parser.endless_sky').EndlessSkyParser
+    M3uParser = import_module('pyparse.parser.m3u').M3uParser
+    mkdtemp = import_module('tempfile').mkdtemp
+    rmtree = import_module('shutil').rmtree
+
+    s = """root1 token1
+    child1 "token 2"
+root2
+"""
+    _summary = lambda _node: (_node.tokens, _node.lines, _node.s, [_child.tokens for _child in _node.children],)
+
+    name = 'ParseCache memory'
+    try:
+        cache = ParseCache(max_bytes=len(s) * 2)
+        nodes = cache.parse(EndlessSkyParser, 'rule_DataFile', s)
+        assert [_summary(_node) for _node in nodes] == [_summary(_node) for _node in EndlessSkyParser(s).rule_DataFile()], nodes
+        assert cache.parse(EndlessSkyParser, 'rule_DataFile', s) is nodes, cache.entries # same object
+        assert (cache.hits, cache.misses, cache.evictions,) == (1, 1, 0,), (cache.hits, cache.misses, cache.evictions,)
+        cache.parse(EndlessSkyParser, 'rule_DataFile', s + 'root3\n')
+        assert (cache.misses, cache.evictions, len(cache),) == (2, 1, 1,), (cache.misses, cache.evictions, len(cache),)
+        assert cache.bytes == len(s) + len('root3\n'), cache.bytes
+        try:
+            cache.parse(EndlessSkyParser, 'rule_DataFile', 'root\n  child\n bad')
+            assert False, cache.entries # expecting ParseError
+        except ParseError:
+            pass
+        assert cache.misses == 3 and len(cache) == 1, (cache.misses, cache.entries,) # failures are not cached
+        cache.versions[EndlessSkyParser] = 'changed'
+        cache.parse(EndlessSkyParser, 'rule_DataFile', s + 'root3\n')
+        assert cache.misses == 4, cache.misses # stale
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'ParseCache disk'
+    try:
+        directory = mkdtemp()
+        try:
+            cache = ParseCache(directory=directory)
+            nodes = cache.parse(EndlessSkyParser, 'rule_DataFile', s)
+            playlist = cache.parse(M3uParser, 'rule_M3u', '#EXTM3U\n#EXTINF:1,a\na.mp3\n')
+            assert len(listdir(directory)) == 2, listdir(directory)
+            cache = ParseCache(directory=directory) # new process
+            loaded = cache.parse(EndlessSkyParser, 'rule_DataFile', s)
+            assert loaded is not nodes and cache.disk_hits == 1, (cache.disk_hits, cache.misses,)
+            assert [_summary(_node) for _node in loaded] == [_summary(_node) for _node in nodes], loaded
+            loaded = cache.parse(M3uParser, 'rule_M3u', '#EXTM3U\n#EXTINF:1,a\na.mp3\n')
+            assert loaded.resources[0].address == playlist.resources[0].address, loaded
+            assert cache.parse(EndlessSkyParser, 'rule_DataFile', s) is not nodes and cache.hits == 1, cache.hits
+            _f = io_open(cache.path(cache.key(M3uParser, 'rule_M3u', '#EXTM3U\n')), 'wb')
+            _f.write('damaged')
+            _f.close()
+            cache.parse(M3uParser, 'rule_M3u', '#EXTM3U\n')
+            assert (cache.disk_hits, cache.evictions,) == (2, 1,), (cache.disk_hits, cache.evictions,)
+            cache.clear()
+            assert listdir(directory) == [] and len(cache) == 0, listdir(directory)
+        finally:
+            rmtree(directory)
+        assert encode([1, slice(1, 2), {'a': StrView('abc', 1)}], EndlessSkyParser) == {'list': (1, {'slice': (1, 2, None,)}, {'dict': (('a', 'bc',),)},)}
+        assert decode(encode([(1, [2],)], EndlessSkyParser), EndlessSkyParser) == [(1, [2],)]
+        try:
+            encode(M3uParser.M3u(), EndlessSkyParser)
+            assert False # expecting ValueError
+        except ValueError:
+            pass
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    println('OG pyparse.parser.cache')
+# fed test
+
+
+__all__ = []
+__builtins__ = {} # enter restricted mode
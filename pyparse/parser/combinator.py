@@ -0,0 +1,586 @@
+# -*- coding: utf8 -*-
+# license: WTFPL version 2, or whatever is closest to "no license" and "public domain" (like Unlicense or CC0)
+r""" Module with parser combinators for ``ParserSkeleton''.
+
+Module ``pyparse.parser.combinator''.
+
+Expressions are built once and compiled into closures:
+ * ``lit(s)'' - literal string, the value is ``s''
+ * ``charclass(chars, ranges)'' - one character of a ``CharClass'', the value is the character
+ * ``seq(e, ...)'' - sequence, the value is a tuple with the values of the expressions
+ * ``alt(e, ...)'' - ordered choice, the value is the value of the first expression that matches
+ * ``many(e)'' - zero or more, the value is a tuple with the values
+ * ``many1(e)'' - one or more, the value is a tuple with the values
+ * ``opt(e)'' - zero or one, the value is ``None'' when absent
+ * ``action(e, func)'' - the value is ``func(value)''
+ * ``forward()'' - placeholder for recursive expressions, see ``Forward.define''
+
+Optimizations done at construction time:
+ * ``many(charclass)'' and ``many1(charclass)'' are a single span scan, the value is the matched string
+ * adjacent literals in a ``seq'' are compared at once, the values stay separate
+ * nested ``alt'' are flattened and the alternatives that can start with each character are precomputed
+
+A compiled expression is a function ``(data, pos) -> (value, pos)'' or ``FAIL''.
+Use ``ParserSkeleton.match'' to apply an expression at the offset of a parser.
+str and unicode data use the string methods directly, the other inputs of ``ParserSkeleton''
+(``mmap'', ``StrView'', ``StreamBuffer'') use a second compilation, see ``Expr.compiled''.
+
+Example:
+```python
+_name = many1(charclass('_', (('a','z',),('A','Z',),)))
+_assign = seq(_name, lit(' = '), _name, lit(';'))
+p = ParserSkeleton('a = b;')
+p.match(_assign) # ('a', ' = ', 'b', ';',)
+```
+"""
+
+
+from __builtin__ import AssertionError
+from __builtin__ import False
+from __builtin__ import NotImplementedError
+from __builtin__ import True
+from __builtin__ import ValueError
+from __builtin__ import enumerate
+from __builtin__ import int
+from __builtin__ import isinstance
+from __builtin__ import len
+from __builtin__ import object
+from __builtin__ import bytearray
+from __builtin__ import str
+from __builtin__ import tuple
+from __builtin__ import unicode
+from importlib import import_module
+from mmap import mmap
+from pyparse.parser import CharClass
+from pyparse.parser import FAIL
+from pyparse.parser import ParserSkeleton
+from pyparse.parser import StreamBuffer
+from pyparse.util import StrView
+from pyparse.util import println
+from re import compile as re_compile
+
+
+def _startswith(data, s, pos):
+    r""" ``data.startswith(s, pos)'' for any input of ``ParserSkeleton''. """
+    if isinstance(data, mmap):
+        return data[pos:pos + len(s)] == s # no startswith
+    return data.startswith(s, pos)
+
+
+def _scan(data, regex, pos):
+    r""" Returns the end of the ``CharClass'' scan ``regex'' that starts at ``pos''. """
+    if isinstance(data, (StreamBuffer, StrView)):
+        return data.match_end(regex, pos)
+    return regex.match(data, pos).end()
+
+
+def _text(data, start, stop):
+    r""" Returns ``data[start:stop]'' as a str. """
+    _text = data[start:stop]
+    if isinstance(_text, StrView):
+        return _text.tostring()
+    return _text
+
+
+class Expr(object):
+    r""" Base class of the expressions. """
+
+    def __init__(self):
+        object.__init__(self)
+        self._compiled = None
+
+    def first(self):
+        r""" Returns a tuple of containers with the characters the expression can start with.
+
+        Returns ``None'' if it is unknown or the expression can match nothing.
+        """
+        return None
+
+    def compiled(self, generic=False):
+        r""" Returns the compiled function, compiling it the first time.
+
+        A ``generic'' function accepts the inputs that are not str or unicode,
+        a bit slower because each access goes through a helper.
+        """
+        if self._compiled is None:
+            self._compiled = {}
+        if generic not in self._compiled:
+            self._compiled[generic] = self.compile(generic)
+        return self._compiled[generic]
+
+    def compile(self, generic=False):
+        raise NotImplementedError # subclass must implement
+# ssalc Expr
+
+
+class Lit(Expr):
+    r""" Literal string. """
+
+    def __init__(self, s):
+        if not isinstance(s, (str, unicode)):
+            raise ValueError, s # expecting str or unicode
+        Expr.__init__(self)
+        self.s = s
+
+    def first(self):
+        if self.s == '':
+            return None
+        return (self.s[0],)
+
+    def compile(self, generic=False):
+        _s = self.s
+        _n = len(_s)
+        if generic:
+            def _lit(data, pos):
+                if _startswith(data, _s, pos):
+                    return (_s, pos + _n)
+                return FAIL
+            return _lit
+        def _lit(data, pos):
+            if data.startswith(_s, pos):
+                return (_s, pos + _n)
+            return FAIL
+        return _lit
+# ssalc Lit
+
+
+class Char(Expr):
+    r""" One character of a ``CharClass''. """
+
+    def __init__(self, charclass):
+        if not isinstance(charclass, CharClass):
+            raise ValueError, charclass # expecting CharClass
+        Expr.__init__(self)
+        self.charclass = charclass
+
+    def first(self):
+        return (self.charclass,)
+
+    def compile(self, generic=False):
+        _charclass = self.charclass
+        if generic:
+            def _char(data, pos):
+                _c = _text(data, pos, pos + 1)
+                if _c == '' or _c not in _charclass:
+                    return FAIL
+                return (_c, pos + 1)
+            return _char
+        _match = re_compile(_charclass.pattern).match
+        def _char(data, pos):
+            _m = _match(data, pos)
+            if _m is None:
+                return FAIL
+            return (_m.group(), pos + 1)
+        return _char
+# ssalc Char
+
+
+class Span(Expr):
+    r""" Fused ``many(charclass)'' or ``many1(charclass)''. """
+
+    def __init__(self, charclass, minimum):
+        Expr.__init__(self)
+        self.charclass = charclass
+        self.minimum = minimum
+
+    def first(self):
+        if self.minimum == 0:
+            return None
+        return (self.charclass,)
+
+    def compile(self, generic=False):
+        if generic:
+            _regex = self.charclass.span_re
+            _minimum = self.minimum
+            def _span(data, pos):
+                _end = _scan(data, _regex, pos)
+                if _end - pos < _minimum:
+                    return FAIL
+                return (_text(data, pos, _end), _end)
+            return _span
+        if self.minimum == 0:
+            _match = re_compile(self.charclass.pattern + '*').match
+        else:
+            _match = re_compile(self.charclass.pattern + '+').match
+        def _span(data, pos):
+            _m = _match(data, pos)
+            if _m is None:
+                return FAIL
+            return (_m.group(), _m.end())
+        return _span
+# ssalc Span
+
+
+class Seq(Expr):
+    r""" Sequence.
+
+    ``steps'' has a step per expression, except adjacent literals that share a step.
+    A step is (literal, values, None) or (None, None, expression).
+    """
+
+    def __init__(self, items):
+        Expr.__init__(self)
+        self.items = tuple(items)
+        _steps = []
+        for _item in self.items:
+            if isinstance(_item, Lit) and _steps and _steps[-1][0] is not None:
+                _s, _values, _ = _steps[-1]
+                _steps[-1] = (_s + _item.s, _values + (_item.s,), None)
+            elif isinstance(_item, Lit):
+                _steps += [(_item.s, (_item.s,), None)]
+            else:
+                _steps += [(None, None, _item)]
+        self.steps = tuple(_steps)
+
+    def first(self):
+        if len(self.items) == 0:
+            return None
+        return self.items[0].first()
+
+    def compile(self, generic=False):
+        _steps = tuple([(_s, _values, _item is not None and _item.compiled(generic) or None) for _s, _values, _item in self.steps])
+        def _seq(data, pos):
+            _result = ()
+            for _s, _values, _func in _steps:
+                if _func is None:
+                    if generic:
+                        if not _startswith(data, _s, pos):
+                            return FAIL
+                    elif not data.startswith(_s, pos):
+                        return FAIL
+                    pos += len(_s)
+                    _result += _values
+                else:
+                    _r = _func(data, pos)
+                    if _r is FAIL:
+                        return FAIL
+                    _result += (_r[0],)
+                    pos = _r[1]
+            return (_result, pos)
+        return _seq
+# ssalc Seq
+
+
+class Alt(Expr):
+    r""" Ordered choice dispatched on the first character. """
+
+    def __init__(self, items):
+        Expr.__init__(self)
+        _items = []
+        for _item in items:
+            if isinstance(_item, Alt):
+                _items += _item.items # flatten
+            else:
+                _items += [_item]
+        self.items = tuple(_items)
+        self.firsts = tuple([_item.first() for _item in self.items])
+
+    def first(self):
+        _containers = ()
+        for _first in self.firsts:
+            if _first is None:
+                return None
+            _containers += _first
+        return _containers
+
+    def candidates(self, c):
+        r""" Returns the indexes of the items that can start with ``c''. """
+        _indexes = ()
+        for _i, _first in enumerate(self.firsts):
+            if _first is None:
+                _indexes += (_i,)
+            elif c != '':
+                for _container in _first:
+                    if c in _container:
+                        _indexes += (_i,)
+                        break
+        return _indexes
+
+    def compile(self, generic=False):
+        _funcs = tuple([_item.compiled(generic) for _item in self.items])
+        _table = {} # lookahead -> (func, ...)
+        _candidates = self.candidates
+        def _alt(data, pos):
+            if generic:
+                _c = _text(data, pos, pos + 1)
+            else:
+                _c = data[pos:pos + 1]
+            _cands = _table.get(_c)
+            if _cands is None:
+                _cands = tuple([_funcs[_i] for _i in _candidates(_c)])
+                _table[_c] = _cands
+            for _func in _cands:
+                _r = _func(data, pos)
+                if _r is not FAIL:
+                    return _r
+            return FAIL
+        return _alt
+# ssalc Alt
+
+
+class Many(Expr):
+    r""" Repetition with a ``minimum'' number of matches. """
+
+    def __init__(self, item, minimum):
+        Expr.__init__(self)
+        self.item = item
+        self.minimum = minimum
+
+    def first(self):
+        if self.minimum == 0:
+            return None
+        return self.item.first()
+
+    def compile(self, generic=False):
+        _func = self.item.compiled(generic)
+        _minimum = self.minimum
+        def _many(data, pos):
+            _result = []
+            while True:
+                _r = _func(data, pos)
+                if _r is FAIL or _r[1] == pos:
+                    break # no match or no progress
+                _result.append(_r[0])
+                pos = _r[1]
+            if len(_result) < _minimum:
+                return FAIL
+            return (tuple(_result), pos)
+        return _many
+# ssalc Many
+
+
+class Opt(Expr):
+    r""" Zero or one. """
+
+    def __init__(self, item):
+        Expr.__init__(self)
+        self.item = item
+
+    def compile(self, generic=False):
+        _func = self.item.compiled(generic)
+        def _opt(data, pos):
+            _r = _func(data, pos)
+            if _r is FAIL:
+                return (None, pos)
+            return _r
+        return _opt
+# ssalc Opt
+
+
+class Action(Expr):
+    r""" Transforms the value with ``func''. """
+
+    def __init__(self, item, func):
+        Expr.__init__(self)
+        self.item = item
+        self.func = func
+
+    def first(self):
+        return self.item.first()
+
+    def compile(self, generic=False):
+        _func = self.item.compiled(generic)
+        _action = self.func
+        def _apply(data, pos):
+            _r = _func(data, pos)
+            if _r is FAIL:
+                return FAIL
+            return (_action(_r[0]), _r[1])
+        return _apply
+# ssalc Action
+
+
+class Forward(Expr):
+    r""" Placeholder for a recursive expression, must be defined before matching. """
+
+    def __init__(self):
+        Expr.__init__(self)
+        self.item = None
+
+    def define(self, item):
+        r""" Sets the expression this placeholder stands for. """
+        if not isinstance(item, Expr):
+            raise ValueError, item # expecting Expr
+        self.item = item
+
+    def compile(self, generic=False):
+        _self = self
+        def _forward(data, pos):
+            return _self.item.compiled(generic)(data, pos)
+        return _forward
+# ssalc Forward
+
+
+def _expr(x):
+    r""" Converts a string to ``Lit'' and a ``CharClass'' to ``Char''. """
+    if isinstance(x, Expr):
+        return x
+    if isinstance(x, (str, unicode)):
+        return Lit(x)
+    if isinstance(x, CharClass):
+        return Char(x)
+    raise ValueError, x # expecting Expr, str, unicode or CharClass
+
+
+def lit(s):
+    r""" Literal string. """
+    return Lit(s)
+
+
+def charclass(chars='', ranges=()):
+    r""" One character of ``CharClass(chars, ranges)''. """
+    return Char(CharClass(chars, ranges))
+
+
+def seq(*items):
+    r""" Sequence, the value is a tuple. """
+    return Seq([_expr(_item) for _item in items])
+
+
+def alt(*items):
+    r""" Ordered choice. """
+    return Alt([_expr(_item) for _item in items])
+
+
+def many(item):
+    r""" Zero or more, a single span scan for a character class. """
+    item = _expr(item)
+    if isinstance(item, Char):
+        return Span(item.charclass, 0)
+    return Many(item, 0)
+
+
+def many1(item):
+    r""" One or more, a single span scan for a character class. """
+    item = _expr(item)
+    if isinstance(item, Char):
+        return Span(item.charclass, 1)
+    return Many(item, 1)
+
+
+def opt(item):
+    r""" Zero or one. """
+    return Opt(_expr(item))
+
+
+def action(item, func):
+    r""" The value is ``func(value)''. """
+    return Action(_expr(item), func)
+
+
+def forward():
+    r""" Placeholder for recursive expressions. """
+    return Forward()
+
+
+def test():
+    println('GO pyparse.parser.combinator')
+    ACCESS_READ = import_module('mmap').ACCESS_READ
+    StringIO = import_module('StringIO').StringIO
+    TemporaryFile = import_module('tempfile').TemporaryFile
+
+    name = 'combinator optimizations'
+    try:
+        e = many(charclass('ab'))
+        assert isinstance(e, Span) and e.minimum == 0, e
+        e = many1(charclass('ab'))
+        assert isinstance(e, Span) and e.minimum == 1, e
+        e = seq('a', lit('b'), charclass('c'), 'd')
+        assert e.steps[0][:2] == ('ab', ('a', 'b',),), e.steps
+        assert len(e.steps) == 3, e.steps
+        e = alt('a', alt('b', 'c'))
+        assert len(e.items) == 3, e.items
+        assert e.candidates('b') == (1,), e.candidates('b')
+        assert e.candidates('') == (), e.candidates('')
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'combinator match'
+    try:
+        _name = many1(charclass('_', (('a','z',),('A','Z',),)))
+        _assign = seq(_name, ' = ', _name, ';')
+        p = ParserSkeleton('a = bc;a =')
+        assert p.match(_assign) == ('a', ' = ', 'bc', ';',), p.state
+        assert p.state.offset == 7, p.state
+        assert p.match(_assign) is FAIL, p.state
+        assert p.state.offset == 7, p.state # not moved
+
+        _number = action(many1(charclass('0123456789')), int)
+        _list = forward()
+        _item = alt(_number, _list)
+        _list.define(action(seq('[', opt(seq(_item, many(seq(',', _item)))), ']'), lambda v: v[1]))
+        p = ParserSkeleton('[1,[2,[]],34]')
+        v = p.match(_list)
+        assert v == (1, ((',', (2, ((',', None,),),),), (',', 34,),),), v
+        assert p[0] is None, p.state
+
+        p = ParserSkeleton('xx')
+        assert p.match(opt('y')) is None, p.state
+        assert p.match(many('x')) == ('x', 'x',), p.state
+        assert p.match(many1('x')) is FAIL, p.state
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'combinator inputs'
+    try:
+        _name = many1(charclass('_', (('a','z',),('A','Z',),)))
+        _assign = seq(_name, ' = ', alt(_name, lit('1')), ';')
+        f = TemporaryFile()
+        f.write('a = bc;a =')
+        f.flush()
+        m = mmap(f.fileno(), 0, access=ACCESS_READ)
+        for _data in ('a = bc;a =', u'a = bc;a =', bytearray('a = bc;a ='), StringIO('a = bc;a ='), m,):
+            p = ParserSkeleton(_data)
+            v = p.match(_assign)
+            assert v == ('a', ' = ', 'bc', ';',) and isinstance(v[2], (str, unicode)), (_data, v)
+            assert p.state.offset == 7, (_data, p.state)
+            assert p.match(_assign) is FAIL and p.state.offset == 7, (_data, p.state)
+            assert p.match(many(charclass('a '))) == 'a ', (_data, p.state)
+        m.close()
+        f.close()
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'combinator endless-sky data lines'
+    try:
+        # the grammar of the benchmark in the commit that added this module
+        EndlessSkyParser = import_module('pyparse.parser.endless_sky').EndlessSkyParser
+        _ws = many1(charclass(ranges=(('\x00','\x09',),('\x0B',' ',),)))
+        _regular = seq(charclass('!', (('$','_',),('a','\xff',),)), many(charclass(ranges=(('!','\xff',),))))
+        _quoted = alt(
+            seq('"', many(charclass(ranges=(('\x00','\x09',),('\x0B','!',),('#','\xff',),))), '"'),
+            seq('`', many(charclass(ranges=(('\x00','\x09',),('\x0B','_',),('a','\xff',),))), '`'),
+        )
+        _token = action(alt(_quoted, _regular), ''.join)
+        _comment = seq('#', many(charclass(ranges=(('\x00','\x09',),('\x0B','\xff',),))))
+        _data_line = action(
+            seq(opt(_ws), many1(action(seq(_token, opt(_ws)), lambda v: v[0])), opt(_comment), '\n'),
+            lambda v: (v[0] or '', v[1],))
+        lines = ['root\n', '  child "a b" `c"d` 12 # comment\n', '\tx\t\n', '"x\n', '# only\n', 'a#b\n', 'x']
+        for _line in lines:
+            p = ParserSkeleton(_line)
+            q = EndlessSkyParser(_line)
+            v = p.match(_data_line)
+            w = q.rule_DataLine()
+            if w is FAIL:
+                assert v is FAIL, (_line, v)
+                continue
+            assert v == (str(w.indent), tuple([str(_t) for _t in w.tokens]),), (_line, v, w)
+            assert p.state.offset == q.state.offset, (_line, p.state, q.state)
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    println('OG pyparse.parser.combinator')
+# fed test
+
+
+__all__ = []
+__builtins__ = {} # enter restricted mode
@@ -3,24 +3,27 @@
 
 
 from __builtin__ import AssertionError
+from __builtin__ import False
 from __builtin__ import True
-from __builtin__ import exit
+from __builtin__ import id
+from __builtin__ import isinstance
+from __builtin__ import ValueError
 from __builtin__ import tuple
 from __builtin__ import len
 from __builtin__ import slice
+from __builtin__ import str
+from __builtin__ import xrange
+from importlib import import_module
+from pyparse.parser import CharClass
+from pyparse.parser import FAIL
+from pyparse.parser import Handler
+from pyparse.parser import ParseError
 from pyparse.parser import ParserSkeleton
 from pyparse.util import IndexToAttrMixin
+from pyparse.util import StrView
 from pyparse.util import println
 
 
-try:
-    assert False # assert must work
-    println('the assert statement does not work, disable optimizations to fix this')
-    exit(1)
-except AssertionError:
-    pass
-
-
 class EndlessSkyParser(ParserSkeleton):
     r""" Parser for the data files of the game ``endless-sky''.
 
@@ -32,178 +35,276 @@ class EndlessSkyParser(ParserSkeleton):
     class DataLine(IndexToAttrMixin): _index_to_attr = ('s','indent','tokens','lineNumber',)
     class DataNode(IndexToAttrMixin): _index_to_attr = ('s','indent','tokens','lines','children',)
 
-    class State(ParserSkeleton.State):
-        def __init__(self, *args, **kwargs):
-            ParserSkeleton.State.__init__(self, *args, **kwargs)
-            self.lineNumber = 1
+    FEED_RULE = 'rule_DataNode'
+    FEED_TAIL = 'rule_Trailer'
+
+    NEWLINE = CharClass('\n')
+    WHITESPACE = CharClass(ranges=(('\x00','\x09',),('\x0B',' ',),)) # <= ' ' except newline
+    DELIMITERS = CharClass(ranges=(('\x00',' ',),)) # whitespace or newline
+    QUOTED = {
+        '"': CharClass('"\n'),
+        '`': CharClass('`\n'),
+    }
 
     def token_NEWLINE(self):
         r""" Read a newline character. """
-        _c = self[0]
-        assert _c == '\n', _c
-        self.state.lineNumber += 1
+        if self[0] != '\n':
+            return self.fail('token_NEWLINE') # expecting a newline
         return self.consume(1)
 
     def token_WHITESPACE(self):
         r""" Read "whitespace". """
-        _n = 0
-        while True:
-            try:
-                _c = self[_n]
-                assert _c is not None, _c
-                assert _c != '\n', _c
-                assert _c <= ' ', _c
-                _n += 1
-            except AssertionError:
-                break
-
-        assert _n > 0, _n
+        _n = self.span(self.WHITESPACE)
+        if _n == 0:
+            return self.fail('token_WHITESPACE') # expecting whitespace
         return self.consume(_n)
 
     def token_COMMENT(self):
         r""" Read a comment. """
-        assert self[0] == '#'
-        _n = 1
-        while True:
-            try:
-                _c = self[_n]
-                assert _c is not None, _c
-                assert _c != '\n', _c
-                _n += 1
-            except AssertionError:
-                break
-
-        assert _n > 0, _n
+        if self[0] != '#':
+            return self.fail('token_COMMENT') # expecting a comment
+        _n = self.span_until(self.NEWLINE)
         return self.consume(_n)
 
     def token_TOKEN(self):
         r""" Read a quoted or regular token. """
-        _quotes = ('"','`',)
         _quote = self[0]
-        if _quote in _quotes:
-            _n = 1
-            while True:
-                try:
-                    _c = self[_n]
-                    assert _c is not None, _c
-                    assert _c != '\n', _c
-                    _n += 1
-                    if _c == _quote:
-                        break
-                except AssertionError:
-                    pass
-            assert _c == _quote, (_c, _quote) # must terminate with the same quote
+        if _quote in self.QUOTED:
+            _n = 1 + self.span_until(self.QUOTED[_quote], 1)
+            if self[_n] != _quote:
+                return self.fail(_quote, _n) # must terminate with the same quote
+            _n += 1
         else:
-            assert _quote is not None, _quote # not end of data
-            assert _quote != '#', _quote # not line comment
-            _n = 0
-            while True:
-                try:
-                    _c = self[_n]
-                    assert _c is not None, _c
-                    assert _c != '\n', _c
-                    assert _c > ' ', _c
-                    _n += 1
-                except AssertionError:
-                    break
-
-        assert _n > 0
+            if _quote is None:
+                return self.fail('token_TOKEN') # not end of data
+            if _quote == '#':
+                return self.fail('token_TOKEN') # not line comment
+            _n = self.span_until(self.DELIMITERS)
+
+        if _n == 0:
+            return self.fail('token_TOKEN') # expecting a token
         return self.consume(_n)
 
     def rule_EmptyLine(self):
         r"""
         rule_EmptyLine = token_WHITESPACE? token_COMMENT? token_NEWLINE
                        ;
+
+        In span mode (see ``spans'') ``s'' is the ``source'' of the line.
         """
-        with self: # revert state on error
-            _s = []
-            _whitespace = self.maybe(self.token_WHITESPACE)
-            if _whitespace is not None:
-                _s += [_whitespace]            
-            _comment = self.maybe(self.token_COMMENT)
-            if _comment is not None:
-                _s += [_comment]
-            _newline = self.token_NEWLINE()
+        _snapshot = self.checkpoint()
+        _build = self.building()
+        _fragments = _build and not self.spans
+        _s = []
+        _start = self.state.offset
+        _whitespace = self.token_WHITESPACE()
+        if _fragments and _whitespace is not FAIL:
+            _s += [_whitespace]
+        _comment = self.token_COMMENT()
+        if _fragments and _comment is not FAIL:
+            _s += [_comment]
+        _newline = self.token_NEWLINE()
+        if _newline is FAIL:
+            self.restore(_snapshot) # revert state on error
+            return FAIL
+        if not _build:
+            return True
+        if _fragments:
             _s += [_newline]
-
-        _s = tuple(_s)
-        _lineNumber = self.state.lineNumber
+            _s = tuple(_s)
+        else:
+            _s = self.source(_start)
+        _lineNumber = self.line()
         return self.EmptyLine(s=_s,lineNumber=_lineNumber)
 
     def rule_DataLine(self):
         r"""
         rule_DataLine = token_WHITESPACE? ( token_DATA token_WHITESPACE? )+ rule_EmptyLine
                       ;; the token_WHITESPACE at the start is the indent
+
+        In validation mode (see ``validate'') only the indent is returned.
+        In span mode (see ``spans'') ``s'' is the ``source'' of the line.
         """
-        with self: # revert state on error
-            _s = []
-            _lineNumber = self.state.lineNumber
-            _indent = self.maybe(self.token_WHITESPACE)
-            if _indent is None:
-                _indent = self.consume(0)
+        _snapshot = self.checkpoint()
+        _validating = self.validating
+        _build = self.building()
+        _fragments = _build and not self.spans
+        _s = []
+        _start = self.state.offset
+        _indent = self.token_WHITESPACE()
+        if _indent is FAIL:
+            _indent = self.consume(0)
+        if _fragments:
             _s += [_indent]
-            _tokens = []
-            while True:
-                try:
-                    _token = self.token_TOKEN()
-                    _tokens += [_token]
-                    _s += [_token]
-                    _whitespace = self.maybe(self.token_WHITESPACE)
-                    if _whitespace is not None:
-                        _s += [_whitespace]
-                except AssertionError:
-                    break # no more tokens
-            _empty_line = self.rule_EmptyLine()
+        _tokens = []
+        _n = 0
+        while True:
+            _token = self.token_TOKEN()
+            if _token is FAIL:
+                break # no more tokens
+            _n += 1
+            if not _validating:
+                _tokens += [_token]
+            if _fragments:
+                _s += [_token]
+            _whitespace = self.token_WHITESPACE()
+            if _fragments and _whitespace is not FAIL:
+                _s += [_whitespace]
+        _empty_line = self.rule_EmptyLine()
+        if _empty_line is FAIL or _n == 0:
+            self.restore(_snapshot) # revert state on error
+            return FAIL # expecting a token
+        if _validating:
+            return _indent
+        _lineNumber = self.line(_start)
+        if not _build:
+            return self.DataLine(s=None,indent=_indent,tokens=_tokens,lineNumber=_lineNumber)
+        if _fragments:
             _s += [_empty_line.s]
-
-        assert len(_tokens) > 0 # expecting a token
-        _s = tuple(_s)
+            _s = tuple(_s)
+        else:
+            _s = self.source(_start)
         return self.DataLine(s=_s,indent=_indent,tokens=_tokens,lineNumber=_lineNumber)
 
     def rule_DataNode(self, parent_indent=None):
         r"""
         rule_DataNode = ( rule_EmptyLine )* rule_DataLine rule_DataNode*
                       ;; the rule_DataNode at the end must be children
+
+        An accepted top-level node is a cut point (see ``commit'').
+        In event mode (see ``listen'') the node is reported as 'DataNode' start/end events
+        with 'TOKEN' events, and the returned node has no ``s'' and no ``children''.
+        In validation mode (see ``validate'') only the indent is returned.
+        In span mode (see ``spans'') ``s'' is the ``source'' of the node and the children
+        do not copy their text into the parent.
         """
-        with self: # revert cursor on error
-            _s = []
-            _lineNumber = self.state.lineNumber
-            while True:
-                _emptyline = self.maybe(self.rule_EmptyLine)
-                if _emptyline is None:
-                    break # no more empty lines
+        _snapshot = self.checkpoint()
+        _validating = self.validating
+        _events = self.handler is not None
+        _build = self.building()
+        _fragments = _build and not self.spans
+        _s = []
+        _start = self.state.offset
+        while True:
+            _emptyline = self.rule_EmptyLine()
+            if _emptyline is FAIL:
+                break # no more empty lines
+            if _fragments:
                 _s += [_emptyline.s]
-            _dataline = self.rule_DataLine()
+        _dataline = self.rule_DataLine()
+        if _dataline is FAIL:
+            self.restore(_snapshot) # revert state on error
+            return FAIL
+        if _validating:
+            _indent = _dataline
+        else:
             _indent = _dataline.indent
-            if parent_indent is None:
-                assert _dataline.indent == '' # must be at line start
-            else:
-                assert _dataline.indent != parent_indent # must be a child
-                assert _dataline.indent.startswith(parent_indent) # must match
+        if parent_indent is None:
+            _ok = _indent == '' # must be at line start
+        else:
+            _ok = _indent != parent_indent and _indent.startswith(parent_indent) # must be a child
+        if not _ok:
+            self.restore(_snapshot) # revert state on error
+            return FAIL
+        if _events:
+            self.start('DataNode')
+            for _token in _dataline.tokens:
+                self.token('TOKEN', _token)
+        elif _fragments:
             _s += [_dataline.s]
-            _children = []
-            while True:
-                try:
-                    with self:
-                        _child = self.rule_DataNode(parent_indent=_indent)
-                        if _children:
-                            assert _children[0].indent == _child.indent, (_children[0].indent, child.indent,) # must be at the same level
-                        _children += [_child]
-                        _s += [_child.s]
-                except AssertionError as err:
-                    break # no more children
-
-        _s = tuple(_s)
-        _tokens = tuple(_dataline.tokens)
-        _lines = slice(_lineNumber, self.state.lineNumber)
-        _children = tuple(_children)
-        _datanode = self.DataNode(s=_s,indent=_indent,tokens=_tokens,lines=_lines,children=_children)
+        _children = []
+        _child_indent = None
+        while True:
+            _before = self.checkpoint()
+            _child = self.maybe(self.rule_DataNode, parent_indent=_indent)
+            if _child is None:
+                break # no more children
+            if _validating:
+                _indent_child = _child
+            else:
+                _indent_child = _child.indent
+            if _child_indent is not None and _child_indent != _indent_child:
+                self.restore(_before)
+                break # must be at the same level
+            _child_indent = _indent_child
+            if _build:
+                _children += [_child]
+            if _fragments:
+                _s += [_child.s]
+
+        if _validating:
+            _datanode = _indent
+        else:
+            _tokens = tuple(_dataline.tokens)
+            _lines = slice(self.line(_start), self.line())
+            if _events:
+                self.end('DataNode')
+                _datanode = self.DataNode(s=None,indent=_indent,tokens=_tokens,lines=_lines,children=None)
+            else:
+                if _fragments:
+                    _s = tuple(_s)
+                else:
+                    _s = self.source(_start)
+                _children = tuple(_children)
+                _datanode = self.DataNode(s=_s,indent=_indent,tokens=_tokens,lines=_lines,children=_children)
+        if parent_indent is None:
+            self.commit() # top-level node accepted
         return _datanode
+
+    def shift(self, result, offset, lines, seen):
+        r""" Moves the ``s'' views and the line numbers of a reused node and its children. """
+        if not isinstance(result, (self.EmptyLine, self.DataLine, self.DataNode)) or id(result) in seen:
+            return
+        seen.add(id(result))
+        if isinstance(result.s, StrView):
+            result.s = self.source(result.s.start + offset, result.s.stop + offset)
+        if not isinstance(result, self.DataNode):
+            result.lineNumber += lines
+            return
+        result.lines = slice(result.lines.start + lines, result.lines.stop + lines)
+        for _child in result.children or ():
+            self.shift(_child, offset, lines, seen)
+
+    def rule_Trailer(self):
+        r"""
+        rule_Trailer = rule_EmptyLine* token_WHITESPACE? token_COMMENT?
+                     ;; the last line does not need a newline
+
+        Consumes the ignorable lines after the last node and returns True.
+        """
+        while True:
+            _emptyline = self.rule_EmptyLine()
+            if _emptyline is FAIL:
+                break # no more empty lines
+        self.token_WHITESPACE()
+        self.token_COMMENT()
+        return True
+
+    def rule_DataFile(self):
+        r"""
+        rule_DataFile = rule_DataNode* rule_Trailer
+                      ;; top-level nodes, then the same ignorable rest as ``feed'' and ``close''
+
+        Returns a tuple with the top-level nodes, or True if not building nodes (see ``building'').
+        """
+        _build = self.building()
+        _nodes = []
+        while True:
+            _node = self.rule_DataNode()
+            if _node is FAIL:
+                break # no more nodes
+            if _build:
+                _nodes += [_node]
+        self.rule_Trailer()
+        if not _build:
+            return True
+        return tuple(_nodes)
 # ssalc EndlessSkyParser
 
 
 def test():
     println('GO pyparse.parser.endless_sky')
+    StringIO = import_module('StringIO').StringIO
 
     name = 'EndlessSkyParser with valid data'
     try:
@@ -248,7 +349,301 @@ root2
         println('FAIL', name)
         raise # print stacktrace
 
-    # TODO test invalid data
+    name = 'EndlessSkyParser spans'
+    try:
+        s = """# comment
+root1 token1
+    child1.1
+    child1.2
+
+root2
+"""
+        p = EndlessSkyParser(s)
+        p.spans = True
+        node = p.maybe(p.rule_DataNode)
+        assert (node.s.start, node.s.stop,) == (0, 49,), node.s # offsets, nothing copied
+        assert node.s.obj is s, node.s # shared input
+        assert str(node.s) == s[:49], node.s
+        assert str(node.children[0].s) == '    child1.1\n', node.children[0].s
+        assert node.tokens == ('root1', 'token1',) and node.lines == slice(1, 5), node
+        node = p.maybe(p.rule_DataNode)
+        assert str(node.s) == '\nroot2\n', node.s # includes the empty line
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print stacktrace
+
+    name = 'EndlessSkyParser edit'
+    try:
+        s = """root1
+    child1 a
+root2
+    child2 b
+root3
+    child3 c
+"""
+        p = EndlessSkyParser(s)
+        p.spans = True
+        memo = p.incremental()
+        nodes = p.rule_DataFile()
+        _start = s.index('child2 b') + len('child2 ')
+        p.edit(_start, 1, 'x\n    child2.1')
+        assert p.state.offset == 0, p.state
+        _hits = memo.hits
+        edited = p.rule_DataFile()
+        assert memo.hits > _hits, (memo.hits, _hits,)
+        assert edited[0] is nodes[0], edited # before the edit
+        assert edited[2] is nodes[2], edited # after the edit, moved
+        assert edited[2].lines == slice(6, 8), edited[2].lines
+        assert str(edited[2].s) == 'root3\n    child3 c\n', edited[2].s
+        s = s[:_start] + 'x\n    child2.1' + s[_start + 1:]
+        p = EndlessSkyParser(s)
+        p.spans = True
+        fresh = p.rule_DataFile()
+        _summary = lambda _node: (_node.tokens, _node.lines, str(_node.s), [_child.tokens for _child in _node.children],)
+        assert [_summary(_node) for _node in edited] == [_summary(_node) for _node in fresh], edited
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print stacktrace
+
+    name = 'EndlessSkyParser commit'
+    try:
+        s = """root1
+    child1
+root2
+    child2
+"""
+        p = EndlessSkyParser(s)
+        memo = p.memoize()
+        node = p.maybe(p.rule_DataNode)
+        assert node.tokens == ('root1',), node
+        assert p.cut == p.state.offset == 17, (p.cut, p.state,)
+        for _key in memo.entries:
+            assert _key[1][0] >= p.cut, _key # evicted before the cut
+        node = p.maybe(p.rule_DataNode)
+        assert node.tokens == ('root2',), node
+        assert p.cut == len(s), p.cut
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print stacktrace
+
+    name = 'EndlessSkyParser stream'
+    try:
+        s = """ship "Ship"
+    attributes
+        "mass" 100
+""" * 100
+        p = EndlessSkyParser(StringIO(s))
+        p.state.data.chunk_size = 32
+        _n = 0
+        while True:
+            node = p.maybe(p.rule_DataNode)
+            if node is None:
+                break
+            assert node.tokens == ('ship', '"Ship"',), node
+            assert node.children[0].children[0].tokens == ('"mass"', '100',), node
+            assert len(p.state.data.buffer) < 32 * 4, p.state.data.buffer # bounded
+            _n += 1
+        assert _n == 100, _n
+        assert p.state.offset == len(s), p.state
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print stacktrace
+
+    name = 'EndlessSkyParser feed'
+    try:
+        s = """ship "Ship"
+    attributes
+        "mass" 100
+""" * 3 + "# end"
+        p = EndlessSkyParser()
+        nodes = []
+        for _i in xrange(0, len(s), 7):
+            nodes += p.feed(s[_i:_i + 7])
+            if _i + 7 <= 46:
+                assert len(nodes) == 0, nodes # next node not seen yet
+        assert len(nodes) == 2, nodes
+        nodes += p.close()
+        assert len(nodes) == 3, nodes
+        for node in nodes:
+            assert node.tokens == ('ship', '"Ship"',), node
+            assert node.children[0].children[0].tokens == ('"mass"', '100',), node
+        assert nodes[2].lines == slice(7, 10), nodes[2]
+        assert p.state.offset == len(s), p.state # ignores the comment without a newline
+
+        p = EndlessSkyParser()
+        assert p.feed("root\n") == [], p.state
+        nodes = p.feed("\"unterminated\nroot\n")
+        assert len(nodes) == 1 and nodes[0].tokens == ('root',), nodes
+        try:
+            p.feed("")
+            assert False, p.state # expecting ValueError
+        except ValueError:
+            pass
+
+        s = 'root\n  bad\n"x\nroot2\n'
+        for _sizes in ([len(s)], [5, 100], [1] * len(s), [3] * 7,):
+            p = EndlessSkyParser()
+            nodes = []
+            _i = 0
+            try:
+                for _size in _sizes:
+                    nodes += p.feed(s[_i:_i + _size])
+                    _i += _size
+                nodes += p.close()
+                assert False, (_sizes, nodes) # expecting ParseError
+            except ParseError as _err:
+                assert (_err.offset, _err.line, _err.column,) == (13, 3, 3,), (_sizes, _err)
+            assert [_node.tokens for _node in nodes] == [('root',)], (_sizes, nodes) # same outcome
+
+        for s in ('root\n  bad\n"x\nroot2\n', '\tb\t#`a`  b#"aa\n', 'a\n\tb "c\n  d\n', 'a b\n  c `d\n',):
+            try:
+                EndlessSkyParser(s).parse('rule_DataFile')
+                assert False, s # expecting ParseError
+            except ParseError as _err:
+                _error = (_err.offset, _err.line, _err.column, _err.expected,)
+            for _size in (len(s), 1, 2, 3, 5, 7,):
+                p = EndlessSkyParser()
+                try:
+                    for _i in xrange(0, len(s), _size):
+                        p.feed(s[_i:_i + _size])
+                    p.close()
+                    assert False, (s, _size,) # expecting ParseError
+                except ParseError as _err:
+                    assert (_err.offset, _err.line, _err.column, _err.expected,) == _error, (s, _size, _err, _error,) # same error
+
+        for s, _offset in (('root\n"x', 7,), ('root\nchild', 10,), ('"x', 2,),):
+            p = EndlessSkyParser()
+            try:
+                p.feed(s)
+                p.close()
+                assert False, (s, p.state) # expecting ParseError
+            except ParseError as _err:
+                assert _err.offset == _offset, (s, _err) # not dropped without a newline at the end
+        for s in ('a\n', 'a\n ', 'a\n# end', 'a\n\n  \t# end', '# only', '', 'a\n b', 'a\n"b', 'a',):
+            _ok = True
+            try:
+                _parsed = [_node.tokens for _node in EndlessSkyParser(s).parse('rule_DataFile')]
+            except ParseError as _err:
+                _ok = False
+                _parsed = _err.offset
+            p = EndlessSkyParser()
+            try:
+                _fed = [_node.tokens for _node in p.feed(s) + p.close()]
+            except ParseError as _err:
+                _fed = _err.offset
+            assert _parsed == _fed, (s, _parsed, _fed,) # same inputs accepted
+            assert EndlessSkyParser(s).validate('rule_DataFile')[0] == _ok, (s, _ok,)
+        p = EndlessSkyParser()
+        nodes = p.feed("root\n\n  \t# end") + p.close()
+        assert [_node.tokens for _node in nodes] == [('root',)] and p.state.offset == 14, p.state
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print stacktrace
+
+    name = 'EndlessSkyParser events'
+    try:
+        s = """outfit "A"
+    cost 1
+ship "Ship"
+    outfits
+        "A" 2
+            nested
+      sibling
+        "B"
+    outfits
+        "C"
+"""
+        class _Handler(Handler):
+            def __init__(self):
+                self.outfits = [] # outfits of ships
+                self.path = []
+                self.tokens = 0
+            def start(self, name):
+                self.path.append(None)
+            def token(self, name, value):
+                self.tokens += 1
+                if self.path[-1] is None:
+                    self.path[-1] = value
+                    if self.path[-3:-1] == ['ship', 'outfits']:
+                        self.outfits.append(value)
+            def end(self, name):
+                self.path.pop()
+        p = EndlessSkyParser(s)
+        handler = p.listen(_Handler())
+        node = p.maybe(p.rule_DataNode)
+        assert node.tokens == ('outfit', '"A"',) and node.children is None, node
+        assert handler.outfits == [], handler.outfits
+        node = p.maybe(p.rule_DataNode)
+        assert node.tokens == ('ship', '"Ship"',), node
+        assert handler.outfits == ['"A"'], handler.outfits
+        assert handler.tokens == 10, handler.tokens # the sibling at the wrong level was reverted
+        assert p.maybe(p.rule_DataNode) is None, p.state # sibling at the wrong level
+        assert len(p.pending) == 0 and handler.path == [], (p.pending, handler.path,)
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print stacktrace
+
+    name = 'EndlessSkyParser validate'
+    try:
+        s = """# comment
+root1 token1 "token 2" `token 3`
+    child1.1 token 1.1
+    child1.2
+
+root2
+
+# ignored
+"""
+        p = EndlessSkyParser(s)
+        nodes = p.rule_DataFile()
+        assert [_node.tokens[0] for _node in nodes] == ['root1', 'root2'], nodes
+        assert [_node.lines for _node in nodes] == [slice(1, 5), slice(5, 7)], nodes
+        assert p.state.offset == len(s), p.state
+        p = EndlessSkyParser(s)
+        assert p.validate('rule_DataFile') == (True, len(s),), p.state
+        assert p.position(p.state.offset) == (9, 1,), p.state
+        s = s.replace('root2', 'root2 "unterminated')
+        p = EndlessSkyParser(s)
+        _offset = s.index('\n', s.index('"unterminated'))
+        assert p.validate('rule_DataFile') == (False, _offset,), p.state # missing quote
+        p = EndlessSkyParser(s)
+        try:
+            p.parse('rule_DataFile')
+            assert False, p.state # expecting ParseError
+        except ParseError as _err:
+            assert (_err.offset, _err.line, _err.column, _err.expected,) == (_offset, 6, 20, ('"',),), _err
+            assert str(_err) == "offset %d (line 6, column 20): expected '\"'" % _offset, str(_err)
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print stacktrace
+
+    name = 'EndlessSkyParser with invalid data'
+    try:
+        s = """root "unterminated
+"""
+        p = EndlessSkyParser(s)
+        node = p.maybe(p.rule_DataNode)
+        assert node is None, node
+        assert p.state.offset == 0, p.state # reverted
+
+        s = """    indented
+"""
+        p = EndlessSkyParser(s)
+        node = p.maybe(p.rule_DataNode)
+        assert node is None, node # not at line start
+        assert p.state.offset == 0, p.state # reverted
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print stacktrace
+
     # TODO test s?
 
     println('OG pyparse.parser.endless_sky')
@@ -5,6 +5,7 @@
 from __builtin__ import AssertionError
 from __builtin__ import exit
 from __builtin__ import tuple
+from pyparse.parser import CharClass
 from pyparse.parser import ParserSkeleton
 from pyparse.util import IndexToAttrMixin
 from pyparse.util import println
@@ -50,6 +51,10 @@ class Lisp1Parser(ParserSkeleton):
     class MetaExpression(IndexToAttrMixin): _index_to_attr = ('s','func','args',)
     class ConditionalExpressions(IndexToAttrMixin): _index_to_attr = ('s','expressions',)
 
+    DOT = '·' # not a single character in a str, two bytes in UTF-8
+    DELIMITERS = CharClass('(, )[;\t]') # and DOT
+    COMMAS = CharClass(', ')
+
     def token_ATOM(self):
         """ Atomic symbol. (@see pages 10-11)
 
@@ -63,17 +68,11 @@ class Lisp1Parser(ParserSkeleton):
 
         TODO is a space an atom in LISP-SAP? (@see page 54)
         """
-        _delimiters = ('(','·',',',' ',')','[',';','\t',']',)
-        _n = 0
-        while True:
-            _c = self[_n]
-            if _c is None:
-                break
-            if _c in _delimiters:
-                break
-            _n += 1
-        assert _n >= 0
-        _s = self.cursor.consume(_n)
+        _n = self.span_until(self.DELIMITERS)
+        _dot = self[0:_n].find(self.DOT)
+        if _dot >= 0:
+            _n = _dot
+        _s = self.consume(_n)
         return self.Atom(s=_s)
 
     def token_COMMA(self):
@@ -82,16 +81,7 @@ class Lisp1Parser(ParserSkeleton):
         @see page 66
         @see page 32  "Note that spaces are used in place of commas."
         """
-        _commas = (',',' ')
-        _n = 0
-        while True:
-            _c = self[_n]
-            if _c is None:
-                break
-            if _c not in _commas:
-                break
-            _n += 1
-        assert _n >= 0
+        _n = self.span(self.COMMAS)
         _s = self.consume(_n)
         return self.Comma(s=_s)
 
@@ -127,9 +117,9 @@ class Lisp1Parser(ParserSkeleton):
 
             _e1 = self.rule_S_expression()
             _s += [_e1.s]
-            if self[0] == '·':
+            if self.starts_with(self.DOT):
                 # (e1·e2)
-                _s += [self.consume(1)] # '·'
+                _s += [self.consume(len(self.DOT))] # '·'
                 _e2 = self.rule_S_expression()
                 _s += [_e2.s]
                 assert self[0] == ')'
@@ -3,21 +3,22 @@
 
 
 from __builtin__ import AssertionError
+from __builtin__ import False
 from __builtin__ import True
+from __builtin__ import bytearray
 from __builtin__ import len
+from __builtin__ import list
+from __builtin__ import xrange
+from importlib import import_module
+from pyparse.parser import CharClass
+from pyparse.parser import FAIL
+from pyparse.parser import FeedBuffer
+from pyparse.parser import Handler
 from pyparse.parser import ParserSkeleton
 from pyparse.util import IndexToAttrMixin
 from pyparse.util import println
 
 
-try:
-    assert False # assert must work
-    println('the assert statement does not work, disable optimizations to fix this')
-    exit(1)
-except AssertionError:
-    pass
-
-
 class M3uParser(ParserSkeleton):
     r""" Playlist format of files that end with '.m3u'.
 
@@ -44,16 +45,27 @@ class M3uParser(ParserSkeleton):
 
     EXTM3U = '#EXTM3U'
     EXTINF = '#EXTINF:'
+    NEWLINE = CharClass('\n')
 
     class M3uResource(IndexToAttrMixin): _index_to_attr = ('address','ext',)
     class M3u(IndexToAttrMixin): _index_to_attr = ('resources','ext',)
 
+    class State(ParserSkeleton.State):
+        _fields = ParserSkeleton.State._fields + ('ext_m3u','ext',)
+        def __init__(self, *args, **kwargs):
+            ParserSkeleton.State.__init__(self, *args, **kwargs)
+            self.ext_m3u = None # header line, False if not extended
+            self.ext = None # metadata of the next resource
+
+    FEED_RULE = 'rule_Resource'
+
     def token_NEWLINE(self):
         r"""
         token_NEWLINE = '\n'
                       ;
         """
-        assert self[0] == '\n'
+        if self[0] != '\n':
+            return self.fail('token_NEWLINE') # expecting a newline
         return self.consume(1)
 
     def rule_Line(self):
@@ -61,54 +73,96 @@ class M3uParser(ParserSkeleton):
         rule_Line = ( ! token_NEWLINE )*
                   ;
         """
-        _n = 0
-        while True:
-            _c = self[_n]
-            if _c is None or _c == '\n':
-                break
-            _n += 1
+        _n = self.span_until(self.NEWLINE)
         return self.consume(_n)
 
-    def rule_M3u(self):
+    def rule_Resource(self):
         r"""
-        rule_M3u = rule_Line +
-                 ;; "Each line in a M3U is either a comment, a blank, or a resource to render."
+        rule_Resource = ( rule_Line token_NEWLINE )* rule_Line token_NEWLINE?
+                      ;; comments and blank lines, then the resource
+
+        Returns ``FAIL'' if there are no more resources.
+        The lines before the resource are not cut points, the rule can still fail after them,
+        the callers cut after each resource (see ``rule_M3u'' and ``feed'').
+        In event mode (see ``listen'') the resource is reported as 'Resource' start/end events
+        with 'ext' and 'address' events, and the address is returned.
+        In validation mode (see ``validate'') True is returned.
         """
         _exts = (self.EXTM3U,)
-        _ext = None
-        _ext_m3u = None
-        _resources = []
         while True:
             _line = self.rule_Line()
+            _resource = None
             if _line.strip() == '':
                 # blank line
                 pass
             elif _line[0] == '#':
                 # comment
-                if _ext_m3u is None:
+                if self.state.ext_m3u is None:
                     if _line.strip() in _exts:
-                        _ext_m3u = _line
+                        self.state.ext_m3u = _line
                     else:
-                        _ext_m3u = False
-                if _ext_m3u == self.EXTM3U and _line.startswith(self.EXTINF):
-                    _ext = _line
+                        self.state.ext_m3u = False
+                if self.state.ext_m3u == self.EXTM3U and _line.startswith(self.EXTINF):
+                    self.state.ext = _line
                 else:
-                    _ext = None
+                    self.state.ext = None
+            elif self.validating:
+                # resource, not built
+                _resource = True
+            elif self.handler is not None:
+                # resource event
+                self.start('Resource')
+                if self.state.ext is not None:
+                    self.token('ext', self.state.ext)
+                self.token('address', _line)
+                self.end('Resource')
+                _resource = _line
             else:
                 # resource
-                _resource = self.M3uResource(address=_line,ext=_ext)
-                _resources += [_resource]
+                _resource = self.M3uResource(address=_line,ext=self.state.ext)
+
+            _newline = self.token_NEWLINE()
+            if _resource is not None:
+                return _resource
+            if _newline is FAIL:
+                return FAIL # no more lines
 
-            _newline = self.maybe(self.token_NEWLINE)
-            if _newline is None:
-                break # no more lines
+    def rule_M3u(self):
+        r"""
+        rule_M3u = rule_Resource *
+                 ;; "Each line in a M3U is either a comment, a blank, or a resource to render."
+
+        Each accepted resource is a cut point (see ``commit'').
+        In event mode (see ``listen'') the playlist is reported as 'M3u' start/end events
+        and the returned playlist has no ``resources''.
+        In validation mode (see ``validate'') True is returned.
+        """
+        _events = self.handler is not None
+        _build = self.building()
+        if _events:
+            self.start('M3u')
+        _resources = []
+        while True:
+            _resource = self.rule_Resource()
+            if _resource is FAIL:
+                break # no more resources
+            if _build:
+                _resources += [_resource]
+            self.commit() # resource accepted
 
-        return self.M3u(resources=_resources,ext=_ext_m3u)
+        if self.validating:
+            return True
+        if _events:
+            self.end('M3u')
+            self.commit() # playlist accepted
+            return self.M3u(resources=None,ext=self.state.ext_m3u)
+        return self.M3u(resources=_resources,ext=self.state.ext_m3u)
 # ssalc M3uParser
 
 
 def test():
     println('GO pyparse.parser.m3u')
+    StringIO = import_module('StringIO').StringIO
 
     name = 'M3uParser m3u'
     try:
@@ -151,6 +205,136 @@ empty.mkv
         println('FAIL', name)
         raise # print traceback
 
+    name = 'M3uParser trailing blank line'
+    try:
+        p = M3uParser('a\n\n')
+        assert p.maybe(p.rule_Resource).address == 'a', p.state
+        assert p.maybe(p.rule_Resource) is None, p.state # no CutError
+        assert p.state.offset == 2, p.state
+        m3u = M3uParser('a\n\n#c\n').rule_M3u()
+        assert [_r.address for _r in m3u.resources] == ['a'], m3u
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'M3uParser bytearray'
+    try:
+        s = bytearray("#EXTM3U\n#EXTINF:1,One Second\none_second.mkv\n")
+        p = M3uParser(s)
+        m3u = p.rule_M3u()
+        assert m3u.ext == '#EXTM3U', m3u
+        assert len(m3u.resources) == 1, m3u
+        assert m3u.resources[0].address == 'one_second.mkv', m3u
+        assert m3u.resources[0].address.obj is s, m3u # not copied
+        assert m3u.resources[0].ext == '#EXTINF:1,One Second', m3u
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'M3uParser events'
+    try:
+        s = "#EXTM3U\n" + "#EXTINF:1,One Second\none_second.mkv\n" * 1000
+        class _Handler(Handler):
+            def __init__(self):
+                self.addresses = []
+            def token(self, name, value):
+                if name == 'address':
+                    self.addresses.append(value)
+        p = M3uParser(StringIO(s))
+        handler = p.listen(_Handler())
+        m3u = p.rule_M3u()
+        assert m3u.ext == '#EXTM3U' and m3u.resources is None, m3u
+        assert len(handler.addresses) == 1000, handler.addresses
+        assert handler.addresses[999] == 'one_second.mkv', handler.addresses
+        assert len(p.pending) == 0, p.pending
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'M3uParser validate'
+    try:
+        s = "#EXTM3U\n" + "#EXTINF:1,One Second\none_second.mkv\n" * 100
+        p = M3uParser(s)
+        assert p.validate('rule_M3u') == (True, len(s),), p.state
+        p = M3uParser('#EXTM3U\n#c\nx\n')
+        assert p.validate('rule_Resource') == (True, 13,), p.state
+        p = M3uParser('#EXTM3U\n#c\n')
+        assert p.validate('rule_Resource') == (False, 11,), p.state # no resource, no CutError
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'M3uParser stream'
+    try:
+        s = "#EXTM3U\n" + "#EXTINF:1,One Second\none_second.mkv\n" * 1000
+        p = M3uParser(StringIO(s))
+        p.state.data.chunk_size = 64
+        m3u = p.rule_M3u()
+        assert m3u.ext == '#EXTM3U', m3u
+        assert len(m3u.resources) == 1000, m3u
+        assert m3u.resources[999].address == 'one_second.mkv', m3u
+        assert m3u.resources[999].ext == '#EXTINF:1,One Second', m3u
+        assert len(p.state.data.buffer) < 64 * 3, p.state.data.buffer # bounded
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'M3uParser feed'
+    try:
+        s = "#EXTM3U\n#EXTINF:1,One Second\none_second.mkv\n\n#EXTINF:0,Empty\nempty.mkv"
+        p = M3uParser(FeedBuffer(chunk_size=8))
+        _resources = []
+        for _i in xrange(0, len(s), 5):
+            _resources += p.feed(s[_i:_i + 5])
+            if _i + 5 < 44:
+                assert len(_resources) == 0, _resources # incomplete
+            elif _i + 5 < len(s):
+                assert len(_resources) == 1, _resources # as soon as the newline is seen
+        _resources += p.close()
+        assert p.state.ext_m3u == '#EXTM3U', p.state
+        assert len(_resources) == 2, _resources
+        assert _resources[0].address == 'one_second.mkv', _resources
+        assert _resources[0].ext == '#EXTINF:1,One Second', _resources
+        assert _resources[1].address == 'empty.mkv', _resources # no newline at the end
+        assert _resources[1].ext == '#EXTINF:0,Empty', _resources
+        assert len(p.state.data.buffer) < len(s), p.state.data.buffer # released
+        p = M3uParser()
+        memo = p.memoize()
+        assert p.feed(s[:30]) == [], p.state # starved, the memo entries are removed
+        assert len(memo) == 0 and memo.misses > 0, (memo.entries, memo.misses,) # the counters keep counting
+        _resources = p.feed(s[30:]) + p.close()
+        assert len(_resources) == 2, _resources
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'M3uParser feed_iter'
+    try:
+        s = "#EXTM3U\n" + "#EXTINF:1,One Second\none_second.mkv\n" * 100
+        p = M3uParser()
+        _source = StringIO(s)
+        _n = 0
+        for _resource in p.feed_iter(_source, chunk_size=16):
+            assert _resource.address == 'one_second.mkv', _resource
+            assert _resource.ext == '#EXTINF:1,One Second', _resource
+            assert _source.tell() < len(s) or _n >= 98, (_n, _source.tell(),) # incremental
+            _n += 1
+        assert _n == 100, _n
+        p = M3uParser()
+        _resources = list(p.feed_iter(["#EXTM3U\n#EXT", "INF:1,A\na.mkv\nb.mkv"]))
+        assert [_r.address for _r in _resources] == ['a.mkv', 'b.mkv'], _resources
+        assert _resources[0].ext == '#EXTINF:1,A', _resources
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
     println('OG pyparse.parser.m3u')
 # fed test
 
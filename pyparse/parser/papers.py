@@ -26,6 +26,7 @@ TODO a token that can have infinite length implies an infinite grammar/language?
 from __builtin__ import AssertionError
 from __builtin__ import True
 from __builtin__ import exit
+from pyparse.parser import CharClass
 from pyparse.parser import ParserSkeleton
 from pyparse.util import IndexToAttrMixin
 from pyparse.util import println
@@ -51,42 +52,22 @@ class SsAnBnCnParser(ParserSkeleton):
     class Cn(IndexToAttrMixin): _index_to_attr = ('n',)
     class Ss(IndexToAttrMixin): _index_to_attr = ('n',)
 
+    A = CharClass('a')
+    B = CharClass('b')
+    C = CharClass('c')
+
     def rule_An(self):
-        _n = 0
-        while True:
-            try:
-                if self[_n] == 'a':
-                    _n += 1
-                    continue
-            except:
-                pass
-            break
+        _n = self.span(self.A)
         _slice = self.consume(_n)
         return self.An(n=_n)
 
     def rule_Bn(self):
-        _n = 0
-        while True:
-            try:
-                if self[_n] == 'b':
-                    _n += 1
-                    continue
-            except:
-                pass
-            break
+        _n = self.span(self.B)
         _slice = self.consume(_n)
         return self.Bn(n=_n)
 
     def rule_Cn(self):
-        _n = 0
-        while True:
-            try:
-                if self[_n] == 'c':
-                    _n += 1
-                    continue
-            except:
-                pass
-            break
+        _n = self.span(self.C)
         _slice = self.consume(_n)
         return self.Cn(n=_n)
 
@@ -3,11 +3,16 @@
 
 
 from __builtin__ import AssertionError
+from __builtin__ import False
+from __builtin__ import True
 from __builtin__ import exit
 from __builtin__ import int
+from __builtin__ import list
 from __builtin__ import ord
 from __builtin__ import range
+from __builtin__ import str
 from __builtin__ import tuple
+from importlib import import_module
 from pyparse.parser import ParserSkeleton
 from pyparse.util import IndexToAttrMixin
 from pyparse.util import println
@@ -60,18 +65,27 @@ class Utf8Parser(ParserSkeleton):
 
     def byte_Leading(self):
         _b = self[0]
-        assert (_b & self.HIGH_2) != self.HIGH_1
+        assert (_b & self.HIGH_2) != self.HIGH_1, self.expecting('byte_Leading')
         _s = self.consume(1)
+        if self.validating:
+            return _b
         return self.Leading(b=_b, s=_s)
 
     def byte_Continuation(self):
         _b = self[0]
-        assert (_b & self.HIGH_2) == self.HIGH_1
+        assert (_b & self.HIGH_2) == self.HIGH_1, self.expecting('byte_Continuation')
         _s = self.consume(1)
+        if self.validating:
+            return _b
         return self.Continuation(b=_b, s=_s)
 
     def rule_Codepoint(self):
-        """ rule_Codepoint = byte_Leading byte_Continuation* """
+        """ rule_Codepoint = byte_Leading byte_Continuation*
+
+        In validation mode (see ``validate'') the bytes are returned as ints
+        and the codepoint is returned as an int.
+        In span mode (see ``spans'') ``s'' is the ``source'' of the bytes.
+        """
         _sub_rules = [
             # _prefix, _prefix_mask, _data_mask, _n_continuation
             (self.HIGH_0, self.HIGH_1, self.LOW_7, 0,), # 0xxxxxxx
@@ -83,22 +97,38 @@ class Utf8Parser(ParserSkeleton):
             # 11111110 is 0xFE, used for the BOM in UTF-16, currently meaningless in utf8
             # 11111111 is 0xFF, used for the BOM in UTF-16, currently meaningless in utf8
         ]
+        _validating = self.validating
+        _fragments = not self.spans
+        _start = self.state.offset
         with self:
             _leading = self.byte_Leading()
-            _b = _leading.b
+            if _validating:
+                _b = _leading
+            else:
+                _b = _leading.b
             for _prefix, _prefix_mask, _data_mask, _n_continuations in _sub_rules:
                 if _prefix == (_b & _prefix_mask):
                     _codepoint = (_b & _data_mask)
                     break
             else:
                 assert False, _b # invalid utf8?
+            if _validating:
+                for _ in range(_n_continuations):
+                    _b = self.byte_Continuation()
+                    _codepoint = (_codepoint << 6) + (_b & self.LOW_6)
+                return _codepoint
             _s = [_leading.s]
             for _ in range(_n_continuations):
                 _continuation = self.byte_Continuation()
                 _b = _continuation.b
                 _codepoint = (_codepoint << 6) + (_b & self.LOW_6)
-                _s += [_continuation.s]
-        return self.Codepoint(codepoint=_codepoint, s=tuple(_s))
+                if _fragments:
+                    _s += [_continuation.s]
+        if _fragments:
+            _s = tuple(_s)
+        else:
+            _s = self.source(_start)
+        return self.Codepoint(codepoint=_codepoint, s=_s)
 
     def codepoint_generator(self):
         while True:
@@ -111,6 +141,9 @@ class Utf8Parser(ParserSkeleton):
 
 def test():
     println('GO pyparse.parser.unicode')
+    ACCESS_READ = import_module('mmap').ACCESS_READ
+    mmap = import_module('mmap').mmap
+    TemporaryFile = import_module('tempfile').TemporaryFile
 
     name = 'Utf8Parser codepoint 0'
     try:
@@ -135,6 +168,40 @@ def test():
         assert c.s == ('\xE2','\x82','\xAC',), c
         c = p.maybe(p.rule_Codepoint)
         assert c is None, c
+        p = Utf8Parser('0' + s)
+        p.spans = True
+        c = p.rule_Codepoint()
+        assert c.s == '0', c
+        c = p.rule_Codepoint()
+        assert (c.codepoint, c.s.start, c.s.stop,) == (0x20AC, 1, 4,), c # offsets, nothing copied
+        assert str(c.s) == s, c
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'Utf8Parser validate'
+    try:
+        s = '0\xE2\x82\xAC0'
+        p = Utf8Parser(s)
+        assert p.validate('rule_Codepoint') == (True, 5,), p.state
+        p = Utf8Parser(s[:3] + s)
+        assert p.validate('rule_Codepoint') == (False, 3,), p.state # truncated €, expecting a continuation byte
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
+    name = 'Utf8Parser mmap'
+    try:
+        f = TemporaryFile()
+        f.write('0\xE2\x82\xAC') # zero (0) and euro (€)
+        f.flush()
+        m = mmap(f.fileno(), 0, access=ACCESS_READ)
+        p = Utf8Parser(m)
+        assert list(p.codepoint_generator()) == [0x30, 0x20AC], p.state
+        m.close()
+        f.close()
         println('PASS', name)
     except:
         println('FAIL', name)
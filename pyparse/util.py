@@ -21,21 +21,36 @@ TODO study https://github.com/tav/scripts/blob/master/safelite.py
      @see http://tav.espians.com/a-challenge-to-break-python-security.html
      @see http://tav.espians.com/paving-the-way-to-securing-the-python-interpreter.html
      @see http://tav.espians.com/update-on-securing-the-python-interpreter.html
-TODO make a strview or similar, memoryview is not satisfactory
 """
 
 
 import __builtin__
 from __builtin__ import AssertionError as _builtin_AssertionError
+from __builtin__ import False          as _builtin_False
 from __builtin__ import IndexError     as _builtin_IndexError
 from __builtin__ import KeyError       as _builtin_KeyError
+from __builtin__ import TypeError      as _builtin_TypeError
+from __builtin__ import ValueError     as _builtin_ValueError
 from __builtin__ import basestring     as _builtin_basestring
+from __builtin__ import buffer         as _builtin_buffer
+from __builtin__ import bytearray      as _builtin_bytearray
+from __builtin__ import chr            as _builtin_chr
 from __builtin__ import enumerate      as _builtin_enumerate
 from __builtin__ import getattr        as _builtin_getattr
+from __builtin__ import hash           as _builtin_hash
 from __builtin__ import int            as _builtin_int
 from __builtin__ import isinstance     as _builtin_isinstance
 from __builtin__ import len            as _builtin_len
+from __builtin__ import max            as _builtin_max
+from __builtin__ import memoryview     as _builtin_memoryview
+from __builtin__ import min            as _builtin_min
+from __builtin__ import object         as _builtin_object
+from __builtin__ import repr           as _builtin_repr
 from __builtin__ import setattr        as _builtin_setattr
+from __builtin__ import slice          as _builtin_slice
+from __builtin__ import str            as _builtin_str
+from __builtin__ import unicode        as _builtin_unicode
+from mmap import mmap                  as _mmap_mmap
 from sys import exc_info               as _sys_exc_info
 
 
@@ -43,14 +58,6 @@ from sys import exc_info               as _sys_exc_info
 println = _builtin_getattr(__builtin__, 'print')
 
 
-try:
-    assert False # assert must work
-    println('the assert statement does not work, disable optimizations to fix this')
-    _builtin_exit(1)
-except _builtin_AssertionError:
-    pass
-
-
 class IndexToAttrMixin:
     r""" Class object that redirects indexes to attributes.
 
@@ -80,6 +87,194 @@ class IndexToAttrMixin:
 # ssalc IndexToAttrMixin
 
 
+class StrView(_builtin_object):
+    r""" Immutable window (obj, start, stop) of a string-like object, nothing is copied.
+
+    ``obj'' can be a str, unicode, bytearray, memoryview, mmap, buffer or ``StrView''.
+    Indexing returns a one character string and slicing returns a ``StrView''.
+    Comparisons, ``startswith'', ``find'' and hashing work on ``obj'' in place when it supports them,
+    ``str(view)'' materializes the text.
+
+    The window is immutable, the contents of a bytearray or mmap must not change while in use.
+    """
+
+    # memoryview does not support str methods or ``re'', work on blocks of this size
+    BLOCK_SIZE = 4096
+
+    def __init__(self, obj, start=0, stop=None):
+        if _builtin_isinstance(obj, StrView):
+            _base = obj.start
+            _limit = obj.stop
+            obj = obj.obj
+        elif _builtin_isinstance(obj, (_builtin_basestring, _builtin_bytearray, _builtin_memoryview, _mmap_mmap, _builtin_buffer)):
+            _base = 0
+            _limit = _builtin_len(obj)
+        else:
+            raise _builtin_ValueError, obj # expecting a string-like object
+        if stop is None:
+            stop = _limit - _base
+        if not (0 <= start <= stop):
+            raise _builtin_IndexError, (start, stop,) # expecting 0 <= start <= stop
+        self.obj = obj
+        self.start = _base + start
+        self.stop = _builtin_min(_base + stop, _limit)
+        if self.start > self.stop:
+            self.start = self.stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def _char(self, index):
+        _c = self.obj[index]
+        if _builtin_isinstance(_c, _builtin_int):
+            return _builtin_chr(_c) # bytearray
+        return _c
+
+    def __getitem__(self, index):
+        if _builtin_isinstance(index, _builtin_slice):
+            _start, _stop, _step = index.indices(self.stop - self.start)
+            if _step != 1:
+                raise _builtin_ValueError, index # expecting a contiguous slice
+            return self.__getslice__(_start, _stop)
+        if index < 0:
+            index += self.stop - self.start
+        if not (0 <= index < self.stop - self.start):
+            raise _builtin_IndexError, index
+        return self._char(self.start + index)
+
+    def __getslice__(self, start, stop):
+        _n = self.stop - self.start
+        start = _builtin_max(0, _builtin_min(start, _n))
+        stop = _builtin_max(start, _builtin_min(stop, _n))
+        return StrView(self, start, stop)
+
+    def tostring(self):
+        r""" Returns a copy of the text. """
+        _s = self.obj[self.start:self.stop]
+        if _builtin_isinstance(_s, _builtin_memoryview):
+            return _s.tobytes()
+        if _builtin_isinstance(_s, _builtin_bytearray):
+            return _builtin_str(_s)
+        return _s
+
+    def __str__(self):
+        return _builtin_str(self.tostring())
+
+    def __unicode__(self):
+        return _builtin_unicode(self.tostring())
+
+    def __repr__(self):
+        return 'StrView(' + _builtin_repr(self.tostring()) + ')'
+
+    def _native(self):
+        r""" True if ``obj'' has ``startswith'' and ``find'' with start and end. """
+        return _builtin_isinstance(self.obj, (_builtin_basestring, _builtin_bytearray))
+
+    def startswith(self, prefix, pos=0):
+        if _builtin_isinstance(prefix, StrView):
+            prefix = prefix.tostring()
+        _start = self.start + pos
+        if _start + _builtin_len(prefix) > self.stop:
+            return _builtin_False
+        if self._native():
+            return self.obj.startswith(prefix, _start, self.stop)
+        return self[pos:pos + _builtin_len(prefix)].tostring() == prefix
+
+    def find(self, sub, pos=0, end=None):
+        r""" Returns the index of the next ``sub'' or -1. """
+        if _builtin_isinstance(sub, StrView):
+            sub = sub.tostring()
+        if end is None:
+            end = self.stop - self.start
+        _start = self.start + _builtin_max(0, pos)
+        _stop = self.start + _builtin_min(end, self.stop - self.start)
+        if _builtin_isinstance(self.obj, _builtin_memoryview):
+            # search in blocks that overlap by len(sub) - 1
+            _n = _builtin_len(sub)
+            while _start + _n <= _stop:
+                _block = self.obj[_start:_builtin_min(_stop, _start + self.BLOCK_SIZE + _n - 1)].tobytes()
+                _i = _block.find(sub)
+                if _i >= 0:
+                    return _start + _i - self.start
+                _start += self.BLOCK_SIZE
+            return -1
+        _i = self.obj.find(sub, _start, _stop)
+        if _i < 0:
+            return -1
+        return _i - self.start
+
+    def __contains__(self, sub):
+        return self.find(sub) >= 0
+
+    def match_end(self, regex, pos=0):
+        r""" Returns the index where a ``CharClass'' scan that starts at ``pos'' ends. """
+        _start = self.start + pos
+        if not _builtin_isinstance(self.obj, _builtin_memoryview):
+            return regex.match(self.obj, _start, self.stop).end() - self.start
+        while _start < self.stop:
+            # character class scans can resume where they stopped
+            _block = self.obj[_start:_builtin_min(self.stop, _start + self.BLOCK_SIZE)].tobytes()
+            _end = regex.match(_block).end()
+            _start += _end
+            if _end < _builtin_len(_block):
+                break
+        return _start - self.start
+
+    def strip(self, chars=' \t\n\r\x0b\x0c'):
+        r""" Returns a view without leading and trailing ``chars''. """
+        _start = 0
+        _stop = self.stop - self.start
+        while _start < _stop and self[_start] in chars:
+            _start += 1
+        while _stop > _start and self[_stop - 1] in chars:
+            _stop -= 1
+        return self[_start:_stop]
+
+    def _other(self, other):
+        if _builtin_isinstance(other, StrView):
+            return other.tostring()
+        return other
+
+    def __eq__(self, other):
+        other = self._other(other)
+        if not _builtin_isinstance(other, _builtin_basestring):
+            return _builtin_False
+        if _builtin_len(other) != self.stop - self.start:
+            return _builtin_False
+        return self.startswith(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __lt__(self, other):
+        return self.tostring() < self._other(other)
+
+    def __le__(self, other):
+        return self.tostring() <= self._other(other)
+
+    def __gt__(self, other):
+        return self.tostring() > self._other(other)
+
+    def __ge__(self, other):
+        return self.tostring() >= self._other(other)
+
+    def __hash__(self):
+        # hash of a read-only buffer is the hash of the equivalent str
+        if _builtin_isinstance(self.obj, (_builtin_str, _mmap_mmap)):
+            try:
+                return _builtin_hash(_builtin_buffer(self.obj, self.start, self.stop - self.start))
+            except _builtin_TypeError:
+                pass # writable
+        return _builtin_hash(self.tostring())
+
+    def __add__(self, other):
+        return self.tostring() + self._other(other)
+
+    def __radd__(self, other):
+        return self._other(other) + self.tostring()
+# ssalc StrView
+
+
 def caller_source(nth=1, *args, **kw):
     """ Returns the file name and line number of the ``nth'' caller of this function or ``None''.
 
@@ -117,6 +312,35 @@ def test():
         println('FAIL', name)
         raise # print traceback
 
+    name = 'StrView'
+    try:
+        for _obj in ('xabcdx', _builtin_unicode('xabcdx'), _builtin_bytearray('xabcdx'), _builtin_memoryview('xabcdx'),):
+            _view = StrView(_obj, 1, 5)
+            assert _builtin_len(_view) == 4, _view
+            assert _view == 'abcd', _view
+            assert _view[0] == 'a' and _view[-1] == 'd', _view
+            _sub = _view[1:3]
+            assert _builtin_isinstance(_sub, StrView) and _sub.obj is _obj, _sub # not copied
+            assert _sub == 'bc' and _sub != 'bcd', _sub
+            assert _sub < 'bd' and _sub > 'bb', _sub
+            assert _view.startswith('ab') and _view.startswith(_sub, 1), _view
+            assert not _view.startswith('abcdx'), _view # outside the window
+            assert _view.find('c') == 2 and _view.find('x') == -1, _view
+            assert _builtin_str(_view) == 'abcd', _view
+            assert _sub + 'd' == 'bcd' and 'a' + _sub == 'abc', _sub
+            assert StrView(_obj)[0:6].strip('x') == 'abcd', _view
+            try:
+                _view[4]
+                assert _builtin_False, _view # expecting IndexError
+            except _builtin_IndexError:
+                pass
+        assert _builtin_hash(StrView('xabcdx', 1, 5)) == _builtin_hash('abcd')
+        assert {'abcd': 1}[StrView('xabcdx', 1, 5)] == 1
+        println('PASS', name)
+    except:
+        println('FAIL', name)
+        raise # print traceback
+
     println('OG pyparse.util')
 # fed test
 
@@ -18,11 +18,26 @@ if hasattr(pyparse.parser, 'test'):
     pyparse.parser.test()
 
 
+import pyparse.parser.batch
+if hasattr(pyparse.parser.batch, 'test'):
+    pyparse.parser.batch.test()
+
+
 import pyparse.parser.bnf
 if hasattr(pyparse.parser.bnf, 'test'):
     pyparse.parser.bnf.test()
 
 
+import pyparse.parser.cache
+if hasattr(pyparse.parser.cache, 'test'):
+    pyparse.parser.cache.test()
+
+
+import pyparse.parser.combinator
+if hasattr(pyparse.parser.combinator, 'test'):
+    pyparse.parser.combinator.test()
+
+
 import pyparse.parser.endless_sky
 if hasattr(pyparse.parser.endless_sky, 'test'):
     pyparse.parser.endless_sky.test()